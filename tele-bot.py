@@ -3,11 +3,25 @@ import json
 import logging
 from datetime import datetime, timedelta
 import asyncio
+import bisect
+import heapq
+import html
+import httpx
+import math
 import re
+import sqlite3
+import sys
+import time
+import unicodedata
+import weakref
+from collections import deque
+from itertools import islice
+from operator import attrgetter, itemgetter
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, \
-    ReplyKeyboardRemove
+    ReplyKeyboardRemove, InputMediaPhoto, InlineQueryResultCachedPhoto
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, \
-    ConversationHandler
+    ConversationHandler, InlineQueryHandler, BaseRateLimiter
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
 from apscheduler.triggers.date import DateTrigger
 import requests
 from io import BytesIO
@@ -29,8 +43,16 @@ BOT_TOKEN = "7947027516:AAGFCc6tNRnf3ZVn9Yd6quIfBj1twTsPSi4"
 CHANNEL_ID = "@hayre37"
 ADMIN_USERNAME = "Hayre32"  # Bot administrator username
 AUTO_POST_ENABLED = True
-AUTO_POST_INTERVAL = 6  # Hours between automatic posts
-AUTO_POST_LIMIT = 1  # Number of products to post in each interval
+AUTO_POST_INTERVAL = 6  # Hours over which AUTO_POST_LIMIT products are auto-posted
+AUTO_POST_LIMIT = 1  # Products per interval, posted one at a time at evenly spaced ticks
+# 'album' sends explore pages as one media group plus one keyboard message,
+# 'messages' sends one photo message with its own buttons per product
+PRODUCT_LIST_RENDER_MODE = 'album'
+MY_PRODUCTS_PAGE_SIZE = 8  # Rows per page of a seller's own product list
+CAPTION_LIMIT = 1024  # Longest caption Telegram accepts on a photo
+# Update the tapped message in place for navigation taps (routes added with
+# edits_in_place=True) instead of deleting and resending it
+EDIT_IN_PLACE_NAVIGATION = True
 PRODUCTS_FILE = 'products.json'
 
 # Enable logging
@@ -49,12 +71,83 @@ REGISTER_NAME, REGISTER_PHONE, REGISTER_ADDRESS, REGISTER_CONFIRM = range(7, 11)
 # Product creation states
 SELECT_CATEGORY, SELECT_SUBCATEGORY, CUSTOM_TAG = range(11, 14)
 
-# Track posted products to avoid duplicates
-posted_products = set()
-
 # User preferences storage
 PREFERENCES_FILE = 'preferences.json'
 USERS_FILE = 'users.json'
+PRODUCT_STATS_FILE = 'product_stats.json'  # Per-product view and contact reveal counts
+
+# Storage backend: 'json' keeps the flat files above (user records are appended
+# to USERS_JOURNAL_FILE), 'journal' also appends product mutations to
+# PRODUCTS_JOURNAL_FILE, 'sqlite' uses DATABASE_FILE
+STORAGE_BACKEND = 'json'
+DATABASE_FILE = 'bot.db'
+USERS_JOURNAL_FILE = 'users.journal'
+PRODUCTS_JOURNAL_FILE = 'products.journal'
+JOURNAL_COMPACT_INTERVAL = 300  # Seconds between journal compactions
+
+# Write-behind: JSON mutations are applied in memory and flushed by a single
+# background writer after WRITE_BEHIND_DELAY seconds of coalescing
+WRITE_BEHIND_ENABLED = True
+WRITE_BEHIND_DELAY = 2.0
+CONCURRENT_UPDATES = False  # Let the application process updates concurrently
+
+USER_CACHE_TTL = 300  # Seconds before the cached user directory is re-read from storage
+RESULT_CURSOR_TTL = 1800  # Seconds a paginated result list stays valid after its last use
+RESULT_CURSORS_PER_USER = 5  # Older result lists of a user are dropped beyond this
+
+# Product search
+SEARCH_FIELD_WEIGHTS = {'name': 3, 'category': 2, 'subcategory': 2, 'description': 1}
+SEARCH_RESULT_LIMIT = 200  # Most results a search returns
+SEARCH_PREFIX_EXPANSIONS = 50  # Most words a partially typed last word expands to
+
+# Inline mode (@bot phone in any chat); enable it for the bot with /setinline in @BotFather
+INLINE_RESULTS_PER_PAGE = 50  # Telegram shows at most 50 results per answer
+INLINE_CACHE_TIME = 60  # Seconds Telegram may cache an answer on its side
+INLINE_QUERY_CACHE_SIZE = 512  # Distinct queries kept in the bot's own result cache
+INLINE_QUERY_CACHE_TTL = 120  # Seconds a cached query result stays valid
+
+PRODUCT_RENDER_CACHE_SIZE = 5000  # Products whose rendered captions and keyboards are kept
+
+# Product filters: price bands as [low, high) in ETB, and "added within" choices in days
+PRICE_FILTER_BANDS = [(None, 1000), (1000, 5000), (5000, 10000), (10000, 50000), (50000, None)]
+ADDED_FILTER_DAYS = [1, 7, 30]
+
+# Outbound rate limits (requests per second, burst = requests allowed back to back).
+# Telegram allows about 30 messages per second overall, about one per second in a
+# private chat with short bursts, and 20 per minute in a group or channel
+OUTBOUND_GLOBAL_RATE = 30.0
+OUTBOUND_GLOBAL_BURST = 30
+OUTBOUND_CHAT_RATE = 1.0
+OUTBOUND_CHAT_BURST = 10
+OUTBOUND_CHANNEL_RATE = 20 / 60
+OUTBOUND_CHANNEL_BURST = 3
+OUTBOUND_MAX_RETRIES = 2  # Retries of a request Telegram answered with "retry after"
+# Priority lanes, lowest first: chat replies go ahead of channel posts and notifications
+OUTBOUND_LANES = {'interactive': 0, 'channel': 1, 'notification': 2}
+
+# Channel post delivery: flood limits and connection failures are retried after
+# DELIVERY_BACKOFF_BASE * 2^(attempt - 1) seconds (capped, never sooner than
+# Telegram's retry_after); other failures go to the dead-letter queue
+DELIVERY_MAX_ATTEMPTS = 5
+DELIVERY_BACKOFF_BASE = 2.0
+DELIVERY_BACKOFF_MAX = 60.0
+DEAD_LETTERS_FILE = 'dead_letters.json'
+DEAD_LETTERS_SHOWN = 20  # Entries listed by /deadletters
+OUTBOX_FILE = 'channel_outbox.jsonl'  # Intent and outcome of every channel post
+OUTBOX_COMPACT_INTERVAL = 600  # Seconds between dropping outbox records of saved posts
+
+# Scheduled posts missed by up to this many seconds (e.g. while the bot was down)
+# are posted right away, oldest first; posts missed by longer lose their time
+# and go back to the auto-post queue
+SCHEDULE_CATCH_UP_WINDOW = 24 * 3600
+SCHEDULE_MAX_SLEEP = 60  # Seconds between clock checks while waiting for the next post
+
+DEFAULT_PREFERENCES = {
+    "auto_post": True,
+    "notifications": True,
+    "language": "en",
+    "theme": "light"
+}
 
 # Product categories and subcategories
 PRODUCT_CATEGORIES = {
@@ -71,6 +164,16 @@ PRODUCT_CATEGORIES = {
 }
 
 
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over path, so readers never see a partial file."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
 def load_products():
     if os.path.exists(PRODUCTS_FILE):
         with open(PRODUCTS_FILE, 'r') as f:
@@ -79,8 +182,7 @@ def load_products():
 
 
 def save_products(products):
-    with open(PRODUCTS_FILE, 'w') as f:
-        json.dump(products, f, indent=4)
+    write_json_atomic(PRODUCTS_FILE, products)
 
 
 def load_preferences():
@@ -91,8 +193,7 @@ def load_preferences():
 
 
 def save_preferences(preferences):
-    with open(PREFERENCES_FILE, 'w') as f:
-        json.dump(preferences, f, indent=4)
+    write_json_atomic(PREFERENCES_FILE, preferences)
 
 
 def load_users():
@@ -103,28 +204,603 @@ def load_users():
 
 
 def save_users(users):
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+    write_json_atomic(USERS_FILE, users)
+
+
+class WriteBehindWriter:
+    """Single asyncio task that flushes dirty JSON files in the background.
+
+    Storage marks a file dirty together with a function that snapshots its
+    current in-memory contents. The writer waits WRITE_BEHIND_DELAY seconds so
+    bursts of mutations coalesce into one write, then writes each dirty file
+    atomically off the event loop. Pending changes are flushed on shutdown.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._dirty = {}  # path -> snapshot function
+        self._wakeup = None
+        self._task = None
+        self._lock = asyncio.Lock()  # One flush at a time, so flush() returns only once earlier writes are done
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def is_dirty(self, path):
+        return path in self._dirty
+
+    def mark_dirty(self, path, snapshot):
+        self._dirty[path] = snapshot
+        if self.running:
+            self._wakeup.set()
+        else:
+            # No writer task (e.g. before startup); write through
+            self.flush_sync()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        if self._dirty:
+            self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            # Cancel only between flushes, so a write in progress is never cut short
+            async with self._lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write every dirty file. Snapshots are taken on the event loop, writes happen in a thread."""
+        async with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            done = set()
+            try:
+                for path, snapshot in dirty.items():
+                    try:
+                        await asyncio.to_thread(write_json_atomic, path, snapshot())
+                    except Exception as e:
+                        logger.error(f"Error writing {path}: {e}")
+                        # Retry on the next flush unless a newer snapshot is already queued
+                        self._dirty.setdefault(path, snapshot)
+                    done.add(path)
+            finally:
+                # If the flush is cancelled, files it didn't get to stay dirty
+                for path, snapshot in dirty.items():
+                    if path not in done:
+                        self._dirty.setdefault(path, snapshot)
+            if self._dirty and self.running:
+                # Don't wait for an unrelated mutation to retry the failed writes
+                self._wakeup.set()
+
+    def flush_sync(self):
+        dirty, self._dirty = self._dirty, {}
+        for path, snapshot in dirty.items():
+            write_json_atomic(path, snapshot())
+
+
+class JsonlJournal:
+    """Append-only JSONL file of fsynced records, folded into a snapshot file by compaction.
+
+    Compaction rotates the journal aside before writing the snapshot, so new
+    records go to a fresh file meanwhile, and drops the rotated file once the
+    snapshot is on disk. A rotated file left behind by a failed compaction is
+    replayed before the live journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rotated_path = f"{path}.compacting"
+        self.pending = 0  # Records not folded into the snapshot yet
+        self._file = None
+
+    def replay(self):
+        """Yield the records of the rotated and the live journal, oldest first."""
+        for path in (self.rotated_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append
+                        logger.warning(f"Skipping unreadable journal record in {path}")
+                        continue
+                    yield record
+
+    def append(self, record):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.pending += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def rotate(self):
+        """Move the live journal aside before a snapshot is written."""
+        self.close()
+        if not os.path.exists(self.path):
+            return
+        if os.path.exists(self.rotated_path):
+            # An earlier compaction failed; keep its records and add the new ones
+            with open(self.path, 'r') as src, open(self.rotated_path, 'a') as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.rotated_path)
+
+    def finish(self):
+        """Drop the rotated journal once the snapshot that includes it is written."""
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    def clear(self):
+        """Drop every record, for when the snapshot was rewritten outside compaction."""
+        self.close()
+        for path in (self.rotated_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.pending = 0
+
+
+class JsonStorage:
+    """Storage backend that keeps products, users and preferences in the flat JSON files.
+
+    Without a writer every product or preference mutation rewrites the affected
+    file in full, like the original save_* helpers. With a WriteBehindWriter
+    the files are mirrored in memory, mutations only update the mirror and
+    mark the file dirty, and the writer persists coalesced changes in the
+    background. Users are saved one record at a time: put_user() appends the
+    record to USERS_JOURNAL_FILE and compact() periodically folds the journal
+    into USERS_FILE, so a registration step no longer rewrites every user.
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        self._products = None  # product_id -> product, mirrors PRODUCTS_FILE
+        self._users = None  # mirrors USERS_FILE with the users journal applied
+        self._users_journal = JsonlJournal(USERS_JOURNAL_FILE)
+        self._preferences = None  # mirrors PREFERENCES_FILE when write-behind is enabled
+
+    def _save_products(self):
+        if self.writer is not None:
+            self.writer.mark_dirty(PRODUCTS_FILE, lambda: [p.to_dict() for p in self._products.values()])
+        else:
+            save_products([p.to_dict() for p in self._products.values()])
+
+    def load_products(self):
+        products = [Product.from_dict(p) for p in load_products()]
+        self._products = {p['id']: p for p in products}
+        return products
+
+    def put_product(self, product):
+        if self._products is None:
+            self.load_products()
+        self._products[product['id']] = product
+        self._save_products()
+
+    def update_product(self, product, changes):
+        self.put_product(product)
+
+    def delete_product(self, product_id):
+        if self._products is None:
+            self.load_products()
+        if self._products.pop(product_id, None) is not None:
+            self._save_products()
+
+    def rename_products(self, renamed):
+        """Re-key products whose id changed in place, keeping catalog order."""
+        self._products = {p['id']: p for p in self._products.values()}
+        self._save_products()
+
+    def _users_mirror(self):
+        if self._users is None:
+            self.load_users()
+        return self._users
+
+    def _preferences_mirror(self):
+        if self._preferences is None:
+            self._preferences = load_preferences()
+        return self._preferences
+
+    def load_users(self):
+        # Every saved record is in the journal, so re-reading is always safe
+        users = load_users()
+        replayed = 0
+        for record in self._users_journal.replay():
+            users[record['id']] = record['user']
+            replayed += 1
+        self._users_journal.pending = replayed
+        self._users = users
+        return users
+
+    def get_user(self, user_id):
+        return self._users_mirror().get(str(user_id))
+
+    def put_user(self, user_id, data):
+        self._users_mirror()[str(user_id)] = data
+        self._users_journal.append({'id': str(user_id), 'user': data})
+
+    async def compact(self):
+        """Fold the users journal into a fresh users.json snapshot."""
+        journal = self._users_journal
+        if not journal.pending or self._users is None:
+            return
+        records = journal.pending
+
+        # Rotate and copy on the event loop so the snapshot matches the rotated journal exactly
+        journal.rotate()
+        journal.pending = 0
+        snapshot = {user_id: dict(data) for user_id, data in self._users.items()}
+
+        try:
+            await asyncio.to_thread(save_users, snapshot)
+        except Exception as e:
+            # The rotated journal is kept and retried on the next compaction
+            journal.pending += records
+            logger.error(f"Error compacting users journal: {e}")
+            return
+
+        journal.finish()
+        logger.info(f"Compacted {records} journal records into {USERS_FILE}")
+
+    def load_preferences(self):
+        if self.writer is None:
+            return load_preferences()
+        if not self.writer.is_dirty(PREFERENCES_FILE):
+            self._preferences = load_preferences()
+        return self._preferences_mirror()
+
+    def get_preferences(self, user_id):
+        preferences = self._preferences_mirror() if self.writer is not None else load_preferences()
+        return preferences.get(str(user_id))
+
+    def put_preferences(self, user_id, prefs):
+        if self.writer is None:
+            preferences = load_preferences()
+            preferences[str(user_id)] = prefs
+            save_preferences(preferences)
+            return
+        self._preferences_mirror()[str(user_id)] = prefs
+        self.writer.mark_dirty(PREFERENCES_FILE, lambda: {k: dict(v) for k, v in self._preferences.items()})
+
+
+class JournaledJsonStorage(JsonStorage):
+    """JSON storage that appends product mutations to a journal instead of rewriting products.json.
+
+    Each add, update and delete is written as one fsynced JSONL record, so the
+    cost of a write depends on the size of the change. compact() periodically
+    folds the journal into a new products.json snapshot. On startup the snapshot
+    is loaded and the journal replayed on top of it. All journal operations are
+    idempotent, so replaying a record that already made it into the snapshot
+    is harmless.
+    """
+
+    def __init__(self, journal_path, writer=None):
+        super().__init__(writer)
+        self._journal = JsonlJournal(journal_path)
+
+    def load_products(self):
+        self._products = {p['id']: p for p in map(Product.from_dict, load_products())}
+        replayed = 0
+        for record in self._journal.replay():
+            self._apply(record)
+            replayed += 1
+        self._journal.pending = replayed
+        if replayed:
+            logger.info(f"Replayed {replayed} product journal records")
+        return list(self._products.values())
+
+    def _apply(self, record):
+        op = record.get('op')
+        if op == 'put':
+            product = Product.from_dict(record['product'])
+            self._products[product['id']] = product
+        elif op == 'update':
+            product = self._products.get(record['id'])
+            if product is not None:
+                product.update(record['changes'])
+        elif op == 'delete':
+            self._products.pop(record['id'], None)
+
+    def put_product(self, product):
+        if self._products is None:
+            self.load_products()
+        self._products[product['id']] = product
+        self._journal.append({'op': 'put', 'product': product.to_dict()})
+
+    def update_product(self, product, changes):
+        if self._products is None:
+            self.load_products()
+        # The store hands over a new record on update; keep the mirror pointing at it
+        self._products[product['id']] = product
+        self._journal.append({'op': 'update', 'id': product['id'], 'changes': changes})
+
+    def delete_product(self, product_id):
+        if self._products is None:
+            self.load_products()
+        if self._products.pop(product_id, None) is not None:
+            self._journal.append({'op': 'delete', 'id': product_id})
+
+    def rename_products(self, renamed):
+        # Rewrite the snapshot directly; replaying old-id records on top of it would resurrect them
+        self._products = {p['id']: p for p in self._products.values()}
+        write_json_atomic(PRODUCTS_FILE, [p.to_dict() for p in self._products.values()])
+        self._journal.clear()
+
+    async def compact(self):
+        """Fold the users and product journals into fresh snapshots."""
+        await super().compact()
+        journal = self._journal
+        if not journal.pending or self._products is None:
+            return
+        records = journal.pending
+
+        # Rotate and copy on the event loop so the snapshot matches the rotated journal exactly
+        journal.rotate()
+        journal.pending = 0
+        snapshot = [p.to_dict() for p in self._products.values()]
+
+        try:
+            await asyncio.to_thread(write_json_atomic, PRODUCTS_FILE, snapshot)
+        except Exception as e:
+            # The rotated journal is kept and retried on the next compaction
+            journal.pending += records
+            logger.error(f"Error compacting product journal: {e}")
+            return
+
+        journal.finish()
+        logger.info(f"Compacted {records} journal records into {PRODUCTS_FILE}")
+
+
+class SqliteStorage:
+    """Storage backend on a single SQLite database in WAL mode.
+
+    Products, users and preferences live in their own tables, so a mutation
+    writes one row instead of the whole file, and readers are not blocked while
+    a write is in progress.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS products (
+                    id TEXT PRIMARY KEY,
+                    poster_id INTEGER,
+                    category TEXT,
+                    subcategory TEXT,
+                    posted INTEGER NOT NULL DEFAULT 0,
+                    scheduled_time TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_products_poster_id ON products (poster_id);
+                CREATE INDEX IF NOT EXISTS idx_products_category ON products (category, subcategory);
+                CREATE INDEX IF NOT EXISTS idx_products_posted ON products (posted);
+
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS preferences (
+                    user_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+
+    def load_products(self):
+        # rowid order is insertion order, since updates are done in place
+        rows = self.conn.execute("SELECT data FROM products ORDER BY rowid")
+        return [Product.from_dict(json.loads(data)) for (data,) in rows]
+
+    def _product_row(self, product):
+        return (
+            product['id'],
+            product.get('poster_id'),
+            product.get('category'),
+            product.get('subcategory'),
+            1 if product.get('posted', False) else 0,
+            product.get('scheduled_time'),
+            json.dumps(product.to_dict())
+        )
+
+    def put_product(self, product):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO products (id, poster_id, category, subcategory, posted, scheduled_time, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET poster_id = excluded.poster_id, category = excluded.category, "
+                "subcategory = excluded.subcategory, posted = excluded.posted, "
+                "scheduled_time = excluded.scheduled_time, data = excluded.data",
+                self._product_row(product)
+            )
+
+    def update_product(self, product, changes):
+        self.put_product(product)
+
+    def rename_products(self, renamed):
+        # Update in place so rowid, and with it catalog order, is preserved
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE products SET id = ?, data = ? WHERE id = ?",
+                [(p['id'], json.dumps(p.to_dict()), old_id) for old_id, p in renamed]
+            )
+
+    def delete_product(self, product_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+
+    def load_users(self):
+        rows = self.conn.execute("SELECT user_id, data FROM users")
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def get_user(self, user_id):
+        row = self.conn.execute("SELECT data FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_user(self, user_id, data):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)",
+                (str(user_id), json.dumps(data))
+            )
+
+    def load_preferences(self):
+        rows = self.conn.execute("SELECT user_id, data FROM preferences")
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def get_preferences(self, user_id):
+        row = self.conn.execute("SELECT data FROM preferences WHERE user_id = ?", (str(user_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_preferences(self, user_id, prefs):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO preferences (user_id, data) VALUES (?, ?)",
+                (str(user_id), json.dumps(prefs))
+            )
+
+    def migrate_from_json(self):
+        """Import the JSON files once. Later calls are no-ops."""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return False
+
+        products = load_products()
+        users = JsonStorage().load_users()  # Includes users saved to the journal since the last compaction
+        preferences = load_preferences()
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO products (id, poster_id, category, subcategory, posted, scheduled_time, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._product_row(Product.from_dict(p)) for p in products]
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, data) VALUES (?, ?)",
+                [(user_id, json.dumps(data)) for user_id, data in users.items()]
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO preferences (user_id, data) VALUES (?, ?)",
+                [(user_id, json.dumps(data)) for user_id, data in preferences.items()]
+            )
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),)
+            )
+
+        logger.info(
+            f"Migrated {len(products)} products, {len(users)} users and "
+            f"{len(preferences)} preference records from JSON to {self.path}")
+        return True
+
+
+def create_storage(backend):
+    """Create the configured storage backend."""
+    if backend == 'sqlite':
+        sqlite_storage = SqliteStorage(DATABASE_FILE)
+        sqlite_storage.migrate_from_json()
+        return sqlite_storage
+    writer = storage_writer if WRITE_BEHIND_ENABLED else None
+    if backend == 'journal':
+        return JournaledJsonStorage(PRODUCTS_JOURNAL_FILE, writer)
+    if backend != 'json':
+        logger.warning(f"Unknown storage backend '{backend}', falling back to JSON files")
+    return JsonStorage(writer)
+
+
+storage_writer = WriteBehindWriter(WRITE_BEHIND_DELAY)
+storage = create_storage(STORAGE_BACKEND)
+
+
+class UserDirectory:
+    """In-memory directory of registered users.
+
+    Users are loaded from storage in one go and served from a dict. The whole
+    directory is re-read once it is older than the TTL (or after invalidate()),
+    which picks up edits made to the users file outside the bot. put() updates
+    a single entry and leaves persistence of that entry to the storage backend:
+    SQLite writes the one row and the JSON backends append one journal record.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._users = {}
+        self._loaded_at = None
+
+    def load(self):
+        self._users = dict(storage.load_users())
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """Force a reload from storage on the next lookup."""
+        self._loaded_at = None
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or (self.ttl and time.monotonic() - self._loaded_at > self.ttl):
+            self.load()
+
+    def get(self, user_id):
+        self._ensure_fresh()
+        return self._users.get(str(user_id))
+
+    def is_registered(self, user_id):
+        user_data = self.get(user_id)
+        return user_data is not None and user_data.get('registration_complete', False)
+
+    def put(self, user_id, data):
+        self._ensure_fresh()
+        self._users[str(user_id)] = data
+        storage.put_user(user_id, data)
+
+
+user_directory = UserDirectory(USER_CACHE_TTL)
 
 
 def get_user_data(user_id):
-    users = load_users()
-    user_id_str = str(user_id)
-    if user_id_str in users:
-        return users[user_id_str]
-    return None
+    return user_directory.get(user_id)
 
 
 def save_user_data(user_id, data):
-    users = load_users()
-    user_id_str = str(user_id)
-    users[user_id_str] = data
-    save_users(users)
+    user_directory.put(user_id, data)
 
 
 def is_user_registered(user_id):
-    user_data = get_user_data(user_id)
-    return user_data is not None and user_data.get('registration_complete', False)
+    return user_directory.is_registered(user_id)
 
 
 def is_admin(username):
@@ -132,32 +808,2117 @@ def is_admin(username):
     return username and username.lower() == ADMIN_USERNAME.lower()
 
 
+class PreferenceCache:
+    """In-memory user preferences, loaded once from storage.
+
+    Reads never touch storage: users without stored preferences get
+    DEFAULT_PREFERENCES filled in on the fly, and nothing is written until the
+    user explicitly changes a setting.
+    """
+
+    def __init__(self):
+        self._stored = {}  # user_id str -> preferences persisted for that user
+
+    def load(self):
+        self._stored = dict(storage.load_preferences())
+
+    def get(self, user_id):
+        stored = self._stored.get(str(user_id))
+        if stored is None:
+            return dict(DEFAULT_PREFERENCES)
+        return {**DEFAULT_PREFERENCES, **stored}
+
+    def update(self, user_id, key, value):
+        prefs = self.get(user_id)
+        prefs[key] = value
+        self._stored[str(user_id)] = prefs
+        storage.put_preferences(user_id, prefs)
+
+
+preference_cache = PreferenceCache()
+
+
 def get_user_preferences(user_id):
-    preferences = load_preferences()
-    user_id_str = str(user_id)
-    if user_id_str not in preferences:
-        preferences[user_id_str] = {
-            "auto_post": True,
-            "notifications": True,
-            "language": "en",
-            "theme": "light"
-        }
-        save_preferences(preferences)
-    return preferences[user_id_str]
+    return preference_cache.get(user_id)
 
 
 def update_user_preference(user_id, key, value):
-    preferences = load_preferences()
-    user_id_str = str(user_id)
-    if user_id_str not in preferences:
-        preferences[user_id_str] = {
-            "auto_post": True,
-            "notifications": True,
-            "language": "en",
-            "theme": "light"
+    preference_cache.update(user_id, key, value)
+    if key == 'auto_post' and value:
+        # Put the seller's waiting products back into the auto-post rotation
+        auto_post_planner.resume(user_id)
+
+
+BASE62_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+PRODUCT_ID_EPOCH_MS = 1704067200000  # 2024-01-01 UTC
+PRODUCT_ID_WIDTH = 9
+LEGACY_PRODUCT_ID_WIDTH = 10  # Different width keeps mapped legacy ids disjoint from new ones
+LEGACY_PRODUCT_ID_PATTERN = re.compile(r'^\d+\.\d+$')
+
+
+def base62_encode(number, width=0):
+    digits = []
+    while number:
+        number, remainder = divmod(number, 62)
+        digits.append(BASE62_ALPHABET[remainder])
+    return ''.join(reversed(digits)).rjust(width, '0')
+
+
+def base62_decode(text):
+    number = 0
+    for char in text:
+        number = number * 62 + BASE62_ALPHABET.index(char)
+    return number
+
+
+def is_legacy_product_id(product_id):
+    """Old product ids were str(datetime.now().timestamp())."""
+    return bool(LEGACY_PRODUCT_ID_PATTERN.match(product_id))
+
+
+def legacy_product_id(product_id):
+    """Map an old timestamp id to its compact id. Pure function, so the mapping is O(1) and stable."""
+    microseconds = round(float(product_id) * 1_000_000)
+    return base62_encode(microseconds, LEGACY_PRODUCT_ID_WIDTH)
+
+
+class ProductIdGenerator:
+    """Monotonic, collision-free compact product ids.
+
+    Snowflake-style: milliseconds since PRODUCT_ID_EPOCH_MS shifted left by 12
+    bits plus a per-millisecond sequence, base62 encoded to a fixed width so
+    ids also sort in creation order. If the clock stalls or goes backwards the
+    generator keeps counting from the last issued value instead of reusing it.
+    """
+
+    SEQUENCE_BITS = 12
+
+    def __init__(self):
+        self._last = 0
+
+    def observe(self, product_id):
+        """Make sure ids issued later sort after an existing id."""
+        if len(product_id) == PRODUCT_ID_WIDTH:
+            try:
+                self._last = max(self._last, base62_decode(product_id))
+            except ValueError:
+                pass
+
+    def next_id(self):
+        now_ms = int(time.time() * 1000) - PRODUCT_ID_EPOCH_MS
+        value = max(now_ms << self.SEQUENCE_BITS, self._last + 1)
+        self._last = value
+        return base62_encode(value, PRODUCT_ID_WIDTH)
+
+
+product_ids = ProductIdGenerator()
+
+# Inline button payloads are encoded as "<action>:<arg>:..." and must fit in
+# Telegram's 64-byte callback_data limit. Every action and the types of its
+# arguments are registered on callback_router, next to main().
+CALLBACK_DATA_LIMIT = 64
+CALLBACK_SEPARATOR = ':'
+
+
+def encode_callback(action, *args):
+    """Build callback_data for an inline button."""
+    data = CALLBACK_SEPARATOR.join((action,) + tuple(str(arg) for arg in args))
+    if len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"callback_data is longer than {CALLBACK_DATA_LIMIT} bytes: {data!r}")
+    return data
+
+
+def decode_callback(data):
+    """Split callback_data into (action, args). Plain payloads decode to (data, [])."""
+    action, _, rest = data.partition(CALLBACK_SEPARATOR)
+    return action, rest.split(CALLBACK_SEPARATOR) if rest else []
+
+
+class CallbackRoute:
+    __slots__ = ('action', 'handler', 'schema', 'pass_update', 'edits_in_place')
+
+    def __init__(self, action, handler, schema, pass_update, edits_in_place):
+        self.action = action
+        self.handler = handler
+        self.schema = schema
+        self.pass_update = pass_update
+        self.edits_in_place = edits_in_place
+
+
+class CallbackRouter:
+    """Table-driven dispatch of callback_data to handlers.
+
+    Routes are registered per action (the part of callback_data before the
+    first ':') with a schema of converters for its arguments, e.g.
+    add("page", show_cursor_page, str, int). Resolving is one dict lookup on
+    the action, so the cost doesn't grow with the number of routes and one
+    route can't shadow another the way prefix checks in an if/elif chain can.
+    Free-form payloads such as "category_<name>" are registered with
+    add_prefix() and looked up by their text up to the first '_'.
+
+    Handlers are called with the callback query (or the whole update when
+    registered with pass_update=True), the context and the converted arguments.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._prefix_routes = {}
+
+    def add(self, action, handler, *schema, pass_update=False, edits_in_place=False):
+        """Register a handler for an action whose arguments are converted by schema."""
+        if action in self._routes:
+            raise ValueError(f"Duplicate callback route: {action!r}")
+        self._routes[action] = CallbackRoute(action, handler, schema, pass_update, edits_in_place)
+
+    def add_prefix(self, prefix, handler, pass_update=False):
+        """Register a handler for free-form payloads starting with prefix, which must end in '_'."""
+        if not prefix.endswith('_') or '_' in prefix[:-1]:
+            raise ValueError(f"Prefix routes must contain a single trailing '_': {prefix!r}")
+        self._prefix_routes[prefix] = CallbackRoute(prefix, handler, (), pass_update, False)
+
+    def resolve(self, data):
+        """Return (route, converted args) for callback_data, or (None, None) if nothing matches."""
+        action, raw_args = decode_callback(data)
+        route = self._routes.get(action)
+        if route is None:
+            head, separator, _ = data.partition('_')
+            route = self._prefix_routes.get(head + separator)
+            return (route, ()) if route is not None else (None, None)
+
+        if len(raw_args) != len(route.schema):
+            return None, None
+        if not raw_args:
+            return route, ()
+        try:
+            return route, tuple(convert(value) for convert, value in zip(route.schema, raw_args))
+        except ValueError:
+            return None, None
+
+    def routes(self):
+        return dict(self._routes)
+
+    def prefix_routes(self):
+        return dict(self._prefix_routes)
+
+
+callback_router = CallbackRouter()
+
+
+class Product:
+    """Compact product record.
+
+    Uses __slots__ instead of a per-product dict, interns the strings shared by
+    many products (category, subcategory, poster username) and keeps seller
+    details by reference to the user record instead of copying them into every
+    product. Supports the mapping-style access (product['name'],
+    product.get('posted', False)) the handlers use. Unknown keys from stored
+    records are kept in `extra` so nothing is lost on a round trip.
+    """
+
+    FIELDS = (
+        'id', 'name', 'description', 'price', 'category', 'subcategory', 'image_file_id',
+        'date_added', 'posted', 'poster_username', 'poster_id', 'scheduled_time',
+        'channel_message_id', 'post_date'
+    )
+    # Copies of the seller record stored by older versions; now resolved through `seller`
+    SELLER_COPY_FIELDS = ('poster_name', 'poster_phone', 'poster_address')
+    INTERNED_FIELDS = ('category', 'subcategory', 'poster_username')
+
+    __slots__ = FIELDS + ('extra',)
+
+    _FIELD_SET = frozenset(FIELDS)
+    _get_fields = attrgetter(*FIELDS)
+
+    def __init__(self, **fields):
+        for field in Product.SELLER_COPY_FIELDS:
+            fields.pop(field, None)
+        for field in Product.INTERNED_FIELDS:
+            value = fields.get(field)
+            if isinstance(value, str):
+                fields[field] = sys.intern(value)
+        self.posted = bool(fields.pop('posted', False))
+        for field in Product.FIELDS:
+            if field != 'posted':
+                setattr(self, field, fields.pop(field, None))
+        self.extra = fields or None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self):
+        data = dict(zip(Product.FIELDS, Product._get_fields(self)))
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def seller(self):
+        """The seller's user record, or an empty dict if the seller is unknown."""
+        return user_directory.get(self.poster_id) or {}
+
+    def __getitem__(self, key):
+        if key in Product._FIELD_SET:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in Product._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in Product._FIELD_SET or bool(self.extra and key in self.extra)
+
+    def get(self, key, default=None):
+        if key in Product._FIELD_SET:
+            value = getattr(self, key)
+        elif self.extra:
+            value = self.extra.get(key)
+        else:
+            value = None
+        return default if value is None else value
+
+    def update(self, changes):
+        for key, value in changes.items():
+            self[key] = value
+
+    def copy(self):
+        product = Product.__new__(Product)
+        for field in Product.FIELDS:
+            setattr(product, field, getattr(self, field))
+        product.extra = dict(self.extra) if self.extra else None
+        return product
+
+    def __repr__(self):
+        return f"Product(id={self.id!r}, name={self.name!r})"
+
+
+class IdView:
+    """Read-only view of the first `length` ids of a list that is only ever appended to."""
+
+    __slots__ = ('_ids', '_length')
+
+    def __init__(self, ids, length):
+        self._ids = ids
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step == 1:
+                return tuple(self._ids[start:stop])
+            return tuple(self._ids[i] for i in range(start, stop, step))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("id view index out of range")
+        return self._ids[index]
+
+    def __iter__(self):
+        return islice(self._ids, self._length)
+
+    def __reversed__(self):
+        return (self._ids[i] for i in range(self._length - 1, -1, -1))
+
+
+class IdLog:
+    """Append-only list of product ids whose prefixes are shared instead of copied.
+
+    remove() only marks an id; the list is rebuilt once marked ids make up more
+    than 1/COMPACT_RATIO of it, so removal stays amortized O(1). A rebuild makes
+    a new list and views taken earlier keep the old one, so view() is an O(1)
+    handle on the ids at the time it was taken. Ids removed before a view was
+    taken can still show up in it until the next rebuild; readers skip ids that
+    no longer resolve, as they already do for products deleted after a cursor
+    was opened.
+    """
+
+    COMPACT_RATIO = 8
+
+    __slots__ = ('_ids', '_removed')
+
+    def __init__(self):
+        self._ids = []
+        self._removed = set()
+
+    def __len__(self):
+        return len(self._ids) - len(self._removed)
+
+    def append(self, product_id):
+        self._ids.append(product_id)
+
+    def remove(self, product_id):
+        self._removed.add(product_id)
+        if len(self._removed) * self.COMPACT_RATIO > len(self._ids):
+            self._ids = [pid for pid in self._ids if pid not in self._removed]
+            self._removed = set()
+
+    def view(self):
+        return IdView(self._ids, len(self._ids))
+
+
+class CatalogSnapshot:
+    """Immutable view of the catalog at one version.
+
+    Taking a snapshot is O(1): the order is an IdView of the store's id log and
+    get() asks the store for the record that was current at this version, so
+    nothing is copied however large the catalog is.
+    """
+
+    __slots__ = ('version', 'order', '_store', '_count', '__weakref__')
+
+    def __init__(self, store, version, order, count):
+        self.version = version
+        self.order = order  # IdView of product ids in insertion order
+        self._store = store
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def get(self, product_id):
+        product = self._store.record_at(product_id, self.version)
+        if product is None and is_legacy_product_id(product_id):
+            product = self._store.record_at(legacy_product_id(product_id), self.version)
+        return product
+
+
+class ResultCursorCache:
+    """Per-user cache of the ordered id lists behind paginated product views.
+
+    The first page of a view opens a cursor over a fixed id sequence (a fresh
+    result list or an IdView, kept as is rather than copied); later pages look
+    it up by its short token and slice it, so paging costs
+    O(page size) and pages do not shift when products are added or removed
+    meanwhile (removed products are simply skipped). Cursors expire RESULT_CURSOR_TTL
+    seconds after their last use and each user keeps only the newest few.
+    """
+
+    PRUNE_EVERY = 100  # Sweep expired cursors of all users every N opens
+
+    def __init__(self, ttl, per_user):
+        self.ttl = ttl
+        self.per_user = per_user
+        self._cursors = {}  # user_id -> {token: [product_ids, expires_at]}
+        self._next_token = 0
+        self._opens = 0
+
+    def open(self, user_id, product_ids):
+        """Cache an ordered id sequence for a user and return its token. The sequence must not change afterwards."""
+        now = time.monotonic()
+        self._opens += 1
+        if self._opens % self.PRUNE_EVERY == 0:
+            self.prune(now)
+
+        token = base62_encode(self._next_token, 1)
+        self._next_token += 1
+        user_cursors = self._cursors.setdefault(user_id, {})
+        user_cursors[token] = [product_ids, now + self.ttl]
+        while len(user_cursors) > self.per_user:
+            del user_cursors[next(iter(user_cursors))]
+        return token
+
+    def get(self, user_id, token):
+        """Return the id sequence behind a token, or None if it is unknown or expired."""
+        entry = self._cursors.get(user_id, {}).get(token)
+        now = time.monotonic()
+        if entry is None or entry[1] < now:
+            return None
+        entry[1] = now + self.ttl
+        return entry[0]
+
+    def prune(self, now=None):
+        now = time.monotonic() if now is None else now
+        for user_id in list(self._cursors):
+            user_cursors = self._cursors[user_id]
+            for token in [t for t, (_, expires_at) in user_cursors.items() if expires_at < now]:
+                del user_cursors[token]
+            if not user_cursors:
+                del self._cursors[user_id]
+
+
+result_cursors = ResultCursorCache(RESULT_CURSOR_TTL, RESULT_CURSORS_PER_USER)
+
+
+def category_buckets(product):
+    """Return the (category, None) and (category, subcategory) index keys of a product."""
+    category = product.get('category') or '#Other'
+    subcategory = product.get('subcategory')
+    if subcategory:
+        return (category, None), (category, subcategory)
+    return (category, None),
+
+
+class ProductStore:
+    """In-memory product catalog, loaded once and indexed for handler lookups.
+
+    Products are kept keyed by id in insertion order, with secondary indexes on
+    poster_id and category so handlers never have to re-parse the products
+    file or scan the whole catalog. Posted status and scheduled_time are
+    tracked by the indexes that need them (the post scheduler and auto-post
+    planner).
+
+    Records are copy-on-write: update() replaces a product with a changed copy
+    instead of mutating it, so a record a handler already holds never changes
+    underneath it. Every mutation bumps `version`; snapshot() publishes an
+    immutable CatalogSnapshot of the current version, shared by all readers
+    until the next write. Snapshots share the store's data instead of copying
+    it: the catalog order and category buckets are IdLogs, and each record is
+    stamped with the version that wrote it. A record replaced or deleted while
+    an older snapshot is still in use is kept in a short history until the
+    last such snapshot is gone.
+
+    Other indexes register with add_index() and are kept in sync incrementally.
+    They implement rebuild(products), add(product), replace(old, new) and
+    remove(product).
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._order = IdLog()  # product ids in insertion order
+        self._stamps = {}  # product_id -> version that wrote its current record
+        self._history = {}  # product_id -> [(from version, to version, record)] still visible to snapshots
+        self._retired = deque()  # (to version, product_id) of history entries, oldest first
+        self._snapshots = weakref.WeakValueDictionary()  # version -> snapshot still in use
+        self._by_poster = {}  # poster_id -> {product_id: None}, insertion ordered
+        # (category, None) and (category, subcategory) -> IdLog in insertion order
+        self._by_category = {}
+        # Short integer keys for category/subcategory tags, used in callback_data
+        self._tag_keys = {}
+        self._tags = []
+        for category, subcategories in PRODUCT_CATEGORIES.items():
+            self.tag_key(category)
+            for subcategory in subcategories:
+                self.tag_key(subcategory)
+        self._indexes = []
+        self.version = 0
+        self._snapshot = None
+        self.loaded = False
+
+    def add_index(self, index):
+        """Register an index to be kept in sync with the catalog."""
+        self._indexes.append(index)
+        if self.loaded:
+            index.rebuild(self._by_id.values())
+
+    def load(self):
+        """Load the catalog from storage and rebuild all indexes."""
+        self._by_id.clear()
+        self._order = IdLog()
+        self._stamps.clear()
+        self._history.clear()
+        self._retired.clear()
+        self._by_poster.clear()
+        self._by_category.clear()
+
+        renamed = []
+        for product in storage.load_products():
+            if is_legacy_product_id(product['id']):
+                old_id = product['id']
+                product['id'] = legacy_product_id(old_id)
+                renamed.append((old_id, product))
+            product_ids.observe(product['id'])
+            self._index(product)
+
+        if renamed:
+            storage.rename_products(renamed)
+            logger.info(f"Migrated {len(renamed)} products from timestamp ids to compact ids")
+
+        for index in self._indexes:
+            index.rebuild(self._by_id.values())
+
+        self._publish()
+        self.loaded = True
+        logger.info(f"Loaded {len(self._by_id)} products into the product store")
+
+    def _index(self, product):
+        product_id = product['id']
+        self._by_id[product_id] = product
+        self._stamps[product_id] = self.version + 1
+        self._order.append(product_id)
+        self._by_poster.setdefault(product.get('poster_id'), {})[product_id] = None
+        for bucket in category_buckets(product):
+            self._by_category.setdefault(bucket, IdLog()).append(product_id)
+
+    def _unindex(self, product):
+        product_id = product['id']
+        self._by_id.pop(product_id, None)
+        self._stamps.pop(product_id, None)
+        self._order.remove(product_id)
+        poster_products = self._by_poster.get(product.get('poster_id'))
+        if poster_products is not None:
+            poster_products.pop(product_id, None)
+            if not poster_products:
+                del self._by_poster[product.get('poster_id')]
+        for bucket in category_buckets(product):
+            bucket_ids = self._by_category.get(bucket)
+            if bucket_ids is not None:
+                bucket_ids.remove(product_id)
+                if not bucket_ids:
+                    del self._by_category[bucket]
+
+    def _retire(self, product_id, record):
+        """Keep a record that is being replaced or deleted readable by the snapshots that can see it."""
+        since = self._stamps[product_id]
+        if any(version >= since for version in self._snapshots):
+            until = self.version + 1
+            self._history.setdefault(product_id, []).append((since, until, record))
+            self._retired.append((until, product_id))
+
+    def _publish(self):
+        self.version += 1
+        self._snapshot = None
+        # Drop history no remaining snapshot is old enough to read
+        oldest = min(self._snapshots, default=self.version)
+        while self._retired and self._retired[0][0] <= oldest:
+            _, product_id = self._retired.popleft()
+            entries = self._history[product_id]
+            entries.pop(0)
+            if not entries:
+                del self._history[product_id]
+
+    def snapshot(self):
+        """Return an immutable snapshot of the current catalog version."""
+        if self._snapshot is None:
+            self._snapshot = CatalogSnapshot(self, self.version, self._order.view(), len(self._by_id))
+            self._snapshots[self.version] = self._snapshot
+        return self._snapshot
+
+    def record_at(self, product_id, version):
+        """Return the record of a product as of a catalog version, or None if it didn't exist then."""
+        product = self._by_id.get(product_id)
+        if product is not None and self._stamps[product_id] <= version:
+            return product
+        for since, until, record in self._history.get(product_id, ()):
+            if since <= version < until:
+                return record
+        return None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, product_id):
+        """Return the product with the given id, or None. Old timestamp ids are mapped to compact ids."""
+        product = self._by_id.get(product_id)
+        if product is None and is_legacy_product_id(product_id):
+            product = self._by_id.get(legacy_product_id(product_id))
+        return product
+
+    def all(self):
+        """Return all products in insertion order."""
+        return list(self._by_id.values())
+
+    def by_poster(self, poster_id):
+        """Return the products listed by a user, in insertion order."""
+        return [self._by_id[pid] for pid in self._by_poster.get(poster_id, ())]
+
+    def count_by_poster(self, poster_id):
+        return len(self._by_poster.get(poster_id, ()))
+
+    def tag_key(self, tag):
+        """Return the short key for a category or subcategory tag, assigning one if needed."""
+        key = self._tag_keys.get(tag)
+        if key is None:
+            key = self._tag_keys[tag] = len(self._tags)
+            self._tags.append(tag)
+        return key
+
+    def tag_name(self, key):
+        """Return the tag for a key from tag_key(), or None."""
+        try:
+            return self._tags[int(key)]
+        except (ValueError, IndexError):
+            return None
+
+    def category_ids(self, category, subcategory=None):
+        """Return the ids in a category (or one of its subcategories) in insertion order.
+
+        The result is an IdView of the index bucket as it is now; later changes
+        to the category don't show up in it.
+        """
+        bucket = self._by_category.get((category, subcategory or None))
+        return bucket.view() if bucket is not None else ()
+
+    def category_count(self, category, subcategory=None):
+        bucket = self._by_category.get((category, subcategory or None))
+        return len(bucket) if bucket is not None else 0
+
+    def category_counts(self):
+        """Return {category: product count}, built-in categories first, including empty ones."""
+        counts = {category: 0 for category in PRODUCT_CATEGORIES}
+        for (category, subcategory), bucket_ids in self._by_category.items():
+            if subcategory is None:
+                counts[category] = len(bucket_ids)
+        return counts
+
+    def subcategory_counts(self, category):
+        """Return {subcategory: product count} for a category, built-in subcategories first."""
+        counts = {subcategory: 0 for subcategory in PRODUCT_CATEGORIES.get(category, [])}
+        for (bucket_category, subcategory), bucket_ids in self._by_category.items():
+            if bucket_category == category and subcategory is not None:
+                counts[subcategory] = len(bucket_ids)
+        return counts
+
+    def add(self, product):
+        """Add a new product and persist it."""
+        self._index(product)
+        for index in self._indexes:
+            index.add(product)
+        self._publish()
+        storage.put_product(product)
+        return product
+
+    def update(self, product_id, **changes):
+        """Replace a product with a changed copy, keep the indexes in sync and persist."""
+        previous = self._by_id.get(product_id)
+        if previous is None:
+            return None
+        product = previous.copy()
+        product.update(changes)
+        # Replace in place to keep the catalog order untouched
+        self._retire(product_id, previous)
+        self._by_id[product_id] = product
+        self._stamps[product_id] = self.version + 1
+        for index in self._indexes:
+            index.replace(previous, product)
+
+        self._publish()
+        storage.update_product(product, changes)
+        return product
+
+    def delete(self, product_id):
+        """Remove a product and persist the deletion. Returns the removed product or None."""
+        product = self._by_id.get(product_id)
+        if product is None:
+            return None
+        self._retire(product_id, product)
+        self._unindex(product)
+        for index in self._indexes:
+            index.remove(product)
+        self._publish()
+        storage.delete_product(product_id)
+        return product
+
+
+product_store = ProductStore()
+
+
+SEARCH_TOKEN_RE = re.compile(r"\w+")
+
+
+def search_tokens(text):
+    """Split text into normalized search words.
+
+    NFKC folds full-width and compatibility characters and casefold() folds case,
+    so mixed Latin/Amharic text tokenizes the same way in listings and queries.
+    Ethiopic syllables are word characters, so Amharic words stay whole and the
+    Ethiopic word separators (፡ ።) split them like spaces do.
+    """
+    if not text:
+        return []
+    return SEARCH_TOKEN_RE.findall(unicodedata.normalize('NFKC', str(text)).casefold())
+
+
+class SearchIndex:
+    """Inverted index over product name, description, category and subcategory.
+
+    Each word maps to {product_id: weight}, where the weight sums
+    SEARCH_FIELD_WEIGHTS of the fields the word appears in. A search matches
+    products containing every query word (the last one also as a prefix) and
+    ranks them by weighted IDF score, newer products first on ties.
+    """
+
+    def __init__(self):
+        self._postings = {}  # word -> {product_id: weight}
+        self._doc_words = {}  # product_id -> words, for removal
+        self._vocabulary = []  # sorted words, for prefix lookups
+
+    def __len__(self):
+        return len(self._doc_words)
+
+    def _weights(self, product):
+        weights = {}
+        for field, weight in SEARCH_FIELD_WEIGHTS.items():
+            for word in set(search_tokens(product.get(field))):
+                weights[word] = weights.get(word, 0) + weight
+        return weights
+
+    def _insert(self, product, keep_vocabulary_sorted=True):
+        product_id = product['id']
+        weights = self._weights(product)
+        self._doc_words[product_id] = tuple(weights)
+        for word, weight in weights.items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                if keep_vocabulary_sorted:
+                    bisect.insort(self._vocabulary, word)
+            postings[product_id] = weight
+
+    def rebuild(self, products):
+        """Index a whole catalog from scratch."""
+        self._postings.clear()
+        self._doc_words.clear()
+        for product in products:
+            self._insert(product, keep_vocabulary_sorted=False)
+        self._vocabulary = sorted(self._postings)
+
+    def add(self, product):
+        self._insert(product)
+
+    def remove(self, product):
+        product_id = product['id']
+        for word in self._doc_words.pop(product_id, ()):
+            postings = self._postings[word]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[word]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+
+    def replace(self, old, new):
+        # Most updates only touch posting status; skip re-indexing when no searched field changed
+        if any(old.get(field) != new.get(field) for field in SEARCH_FIELD_WEIGHTS):
+            self.remove(old)
+            self.add(new)
+
+    def _prefix_postings(self, prefix):
+        """Postings of a word plus the words it is a prefix of, partial matches at half weight."""
+        merged = dict(self._postings.get(prefix, ()))
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for word in self._vocabulary[start:start + SEARCH_PREFIX_EXPANSIONS + 1]:
+            if not word.startswith(prefix):
+                break
+            if word == prefix:
+                continue
+            for product_id, weight in self._postings[word].items():
+                weight /= 2
+                if merged.get(product_id, 0) < weight:
+                    merged[product_id] = weight
+        return merged
+
+    def search(self, text, limit=SEARCH_RESULT_LIMIT):
+        """Return the ids of the best matching products, best first."""
+        words = list(dict.fromkeys(search_tokens(text)))
+        if not words:
+            return []
+
+        terms = [self._postings.get(word, {}) for word in words[:-1]]
+        terms.append(self._prefix_postings(words[-1]))
+        # Walk the rarest word's postings and probe the others
+        terms.sort(key=len)
+        if not terms[0]:
+            return []
+        total = len(self._doc_words)
+        terms = [(postings, math.log(1 + total / len(postings))) for postings in terms]
+
+        (candidates, _), rest = terms[0], terms[1:]
+        # Postings are in catalog order; walking them newest first lets nlargest keep
+        # the newer product on equal scores without comparing ids
+        if rest:
+            # Intersect on the dict key views (done in C), then score only the survivors
+            matches = candidates.keys()
+            for postings, _ in rest:
+                matches = matches & postings.keys()
+            scored = ((sum(postings[product_id] * idf for postings, idf in terms), product_id)
+                      for product_id in reversed(candidates) if product_id in matches)
+        else:
+            # With one word the IDF is a constant factor; rank on the weights alone
+            scored = zip(reversed(candidates.values()), reversed(candidates))
+
+        return [product_id for _, product_id in heapq.nlargest(limit, scored, key=itemgetter(0))]
+
+
+search_index = SearchIndex()
+product_store.add_index(search_index)
+
+
+class InlineQueryCache:
+    """LRU cache of inline query results, keyed by normalized query and catalog version.
+
+    Inline queries arrive on every keystroke and often repeat, from the same user
+    paging with an offset or from many users typing the same word. Keying on the
+    catalog version means any product change misses the cache instead of serving
+    stale results; entries also expire after INLINE_QUERY_CACHE_TTL seconds.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = {}  # (words, version) -> (product_ids, expires_at), least recently used first
+
+    def get(self, text):
+        """Return the ordered ids matching an inline query, searching only on a cache miss."""
+        words = tuple(search_tokens(text))
+        key = (words, product_store.version)
+        now = time.monotonic()
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[1] < now:
+            if words:
+                product_ids = tuple(search_index.search(text))
+            else:
+                # An empty query lists the newest products
+                product_ids = tuple(reversed(product_store.snapshot().order[-SEARCH_RESULT_LIMIT:]))
+            entry = (product_ids, now + self.ttl)
+        self._entries[key] = entry
+        while len(self._entries) > self.size:
+            del self._entries[next(iter(self._entries))]
+        return entry[0]
+
+
+inline_query_cache = InlineQueryCache(INLINE_QUERY_CACHE_SIZE, INLINE_QUERY_CACHE_TTL)
+
+
+class PriceIndex:
+    """Product ids sorted by price, per posted status and category.
+
+    Buckets are keyed (status, category, subcategory): status is None for any,
+    or True/False for posted/not posted; category and subcategory are None for
+    the whole catalog, and subcategory is None for a whole category. Each
+    bucket keeps parallel sorted price and id lists, so a price range is two
+    bisects and a slice, and counting a range for facets never touches records.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # (status, category, subcategory) -> ([price, ...], [product_id, ...])
+
+    @staticmethod
+    def _price(product):
+        return float(product.get('price') or 0)
+
+    def _keys(self, product):
+        posted = bool(product.get('posted', False))
+        for status in (None, posted):
+            yield status, None, None
+            for category, subcategory in category_buckets(product):
+                yield status, category, subcategory
+
+    def rebuild(self, products):
+        self._buckets.clear()
+        entries = {}
+        for product in products:
+            entry = (self._price(product), product['id'])
+            for key in self._keys(product):
+                entries.setdefault(key, []).append(entry)
+        for key, bucket in entries.items():
+            # Stable sort: equal prices keep catalog order
+            bucket.sort(key=itemgetter(0))
+            self._buckets[key] = ([price for price, _ in bucket], [product_id for _, product_id in bucket])
+
+    def add(self, product):
+        price = self._price(product)
+        for key in self._keys(product):
+            prices, product_ids = self._buckets.setdefault(key, ([], []))
+            position = bisect.bisect_right(prices, price)
+            prices.insert(position, price)
+            product_ids.insert(position, product['id'])
+
+    def remove(self, product):
+        price = self._price(product)
+        for key in self._keys(product):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            prices, product_ids = bucket
+            start = bisect.bisect_left(prices, price)
+            end = bisect.bisect_right(prices, price)
+            try:
+                position = product_ids.index(product['id'], start, end)
+            except ValueError:
+                continue
+            del prices[position]
+            del product_ids[position]
+            if not prices:
+                del self._buckets[key]
+
+    def replace(self, old, new):
+        if (self._price(old) != self._price(new) or bool(old.get('posted', False)) != bool(new.get('posted', False))
+                or category_buckets(old) != category_buckets(new)):
+            self.remove(old)
+            self.add(new)
+
+    def _span(self, status, category, subcategory, low, high):
+        prices, product_ids = self._buckets.get((status, category, subcategory), ([], []))
+        start = 0 if low is None else bisect.bisect_left(prices, low)
+        end = len(prices) if high is None else bisect.bisect_left(prices, high)
+        return product_ids, start, max(start, end)
+
+    def range(self, status=None, category=None, subcategory=None, low=None, high=None):
+        """Return the ids priced in [low, high), cheapest first."""
+        product_ids, start, end = self._span(status, category, subcategory, low, high)
+        return product_ids[start:end]
+
+    def count(self, status=None, category=None, subcategory=None, low=None, high=None):
+        """Return how many products range() would return, without building the list."""
+        _, start, end = self._span(status, category, subcategory, low, high)
+        return end - start
+
+
+price_index = PriceIndex()
+product_store.add_index(price_index)
+
+
+def category_label(product, end=""):
+    """Return "category - subcategory" followed by end, or "" if the product has no category."""
+    category_info = ""
+    if product.get('category'):
+        category_info = f"{product.get('category')}"
+        if product.get('subcategory'):
+            category_info += f" - {product.get('subcategory')}"
+        category_info += end
+    return category_info
+
+
+class ProductRenderer:
+    """Memoized captions and keyboards for every way a product is shown.
+
+    Seller-supplied text (names, descriptions, tags, seller details) is
+    HTML-escaped in the HTML views, so a "<" or "&" can't break a message.
+
+    Views:
+        card     explore, search and filter pages (HTML)
+        owner    a product card in the seller's own list (plain text)
+        row      one row of the seller's own list (HTML, without the list number)
+        details  product details (HTML)
+        channel  channel post (plain text, without the post date line)
+        contact  seller contact from the Contact Seller button (HTML)
+        listing  product photo with seller details, from a deep link (HTML)
+        inline   inline query result (HTML)
+
+    Entries are kept per product id and hold the record they were rendered from.
+    Records are copy-on-write, so a changed product is a new record and misses;
+    as a ProductStore index the renderer also drops a product's entries as soon
+    as it is updated or deleted. Seller views also key on the seller's details,
+    which live in the user directory rather than on the product.
+    """
+
+    SELLER_VIEWS = frozenset({'contact', 'listing'})
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = {}  # product_id -> (product, {(view, seller): (caption, reply_markup)})
+
+    def render(self, product, view, bot_username=None):
+        """Return (caption, reply_markup) for a product view."""
+        seller = None
+        if view in self.SELLER_VIEWS:
+            details = product.seller
+            seller = (details.get('name'), details.get('phone'), details.get('address'))
+
+        # Re-inserting keeps the dict in least recently used order
+        entry = self._entries.pop(product['id'], None)
+        if entry is None or entry[0] is not product:
+            entry = (product, {})
+        self._entries[product['id']] = entry
+        while len(self._entries) > self.size:
+            del self._entries[next(iter(self._entries))]
+
+        key = (view, seller)
+        rendered = entry[1].get(key)
+        if rendered is None:
+            rendered = entry[1][key] = getattr(self, f"_render_{view}")(product, bot_username)
+        return rendered
+
+    def rebuild(self, products):
+        self._entries.clear()
+
+    def add(self, product):
+        pass
+
+    def replace(self, old, new):
+        self._entries.pop(old['id'], None)
+
+    def remove(self, product):
+        self._entries.pop(product['id'], None)
+
+    @staticmethod
+    def _status(product):
+        if product.get('scheduled_time'):
+            return f"⏰ Scheduled for {product['scheduled_time']}"
+        elif product.get('posted', False):
+            return "✅ Posted"
+        return "⏳ Not posted yet"
+
+    @staticmethod
+    def _contact_button(product, bot_username):
+        if product.get('poster_username'):
+            return InlineKeyboardButton("📞 Contact Seller", url=f"https://t.me/{product.get('poster_username')}")
+        # Fallback to deep link if no username
+        return InlineKeyboardButton("📞 Contact Seller", url=f"https://t.me/{bot_username}?start=item_{product['id']}")
+
+    @staticmethod
+    def _view_post_buttons(product):
+        """A View Post row if the product has been posted and has a message_id."""
+        if product.get('posted', False) and product.get('channel_message_id'):
+            return [[InlineKeyboardButton(
+                "👁️ View Post", url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{product['channel_message_id']}"
+            )]]
+        return []
+
+    def _render_card(self, product, bot_username):
+        category_info = html.escape(category_label(product, "\n"))
+        caption = (
+            f"📦 <b>{html.escape(product['name'])}</b>\n\n"
+            f"{category_info}"
+            f"💰 Price: {product['price']:.2f} ETB\n"
+            f"Status: {self._status(product)}"
+        )
+        keyboard = [
+            [self._contact_button(product, bot_username)],
+            [InlineKeyboardButton("📋 Product Details", callback_data=encode_callback("det", product['id']))],
+            *self._view_post_buttons(product),
+        ]
+        return caption, InlineKeyboardMarkup(keyboard)
+
+    def _render_owner(self, product, bot_username):
+        category_info = category_label(product, "\n")
+        caption = (
+            f"Name: {product['name']}\n"
+            f"{category_info}"
+            f"Price: {product['price']:.2f} ETB\n"
+            f"Added: {product['date_added']}\n"
+            f"Status: {self._status(product)}"
+        )
+        keyboard = []
+        # Only show post button if not already posted
+        if not product.get('posted', False):
+            keyboard.append([InlineKeyboardButton("📢 Post Now", callback_data=encode_callback("post", product['id']))])
+        keyboard.append([InlineKeyboardButton("✏️ Edit", callback_data=encode_callback("edit", product['id']))])
+        keyboard.append([InlineKeyboardButton("🗑️ Delete", callback_data=encode_callback("del", product['id']))])
+        keyboard.extend(self._view_post_buttons(product))
+        return caption, InlineKeyboardMarkup(keyboard)
+
+    def _render_row(self, product, bot_username):
+        category_info = html.escape(category_label(product, " · "))
+        row = (
+            f"<b>{html.escape(product['name'])}</b> - {product['price']:.2f} ETB\n"
+            f"{category_info}{self._status(product)}"
+        )
+        return row, None
+
+    def _render_details(self, product, bot_username):
+        category_info = html.escape(category_label(product, "\n\n"))
+        caption = (
+            f"📦 <b>{html.escape(product['name'])}</b>\n\n"
+            f"{category_info}"
+            f"📝 <b>Description:</b>\n{html.escape(product['description'])}\n\n"
+            f"💰 <b>Price:</b> {product['price']:.2f} ETB\n"
+            f"📅 <b>Added:</b> {product['date_added']}\n"
+            f"🔄 <b>Status:</b> {self._status(product)}"
+        )
+        keyboard = []
+        # Only show post button if not already posted
+        if not product.get('posted', False):
+            keyboard.append([InlineKeyboardButton("📢 Post Now", callback_data=encode_callback("post", product['id']))])
+        keyboard.append([InlineKeyboardButton("📞 Contact Seller", callback_data=encode_callback("seller", product['id']))])
+        keyboard.extend(self._view_post_buttons(product))
+        keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="back_to_main")])
+        return caption, InlineKeyboardMarkup(keyboard)
+
+    def _render_channel(self, product, bot_username):
+        category_info = category_label(product, "\n\n")
+        caption = (
+            f"🆕 NEW PRODUCT 🆕\n\n"
+            f"📌 {product['name']}\n\n"
+            f"{category_info}"
+            f"📝 {product['description']}\n\n"
+            f"💰 Price: {product['price']:.2f} ETB\n\n"
+        )
+        return caption, InlineKeyboardMarkup([[self._contact_button(product, bot_username)]])
+
+    def _render_contact(self, product, bot_username):
+        seller = product.seller
+        caption = (
+            f"📞 <b>Seller Contact Information</b>\n\n"
+            f"Product: <b>{html.escape(product['name'])}</b>\n\n"
+            f"<b>👤 @{html.escape(str(product.get('poster_username', 'Not provided')))}</b>\n"
+            f"Seller Name: {html.escape(str(seller.get('name', 'Not provided')))}\n"
+            f"Phone: {html.escape(str(seller.get('phone', 'Not provided')))}\n"
+            f"Address: {html.escape(str(seller.get('address', 'Not provided')))}\n\n"
+            f"You can contact the seller directly about this product."
+        )
+        keyboard = [
+            [InlineKeyboardButton("🔙 Back", callback_data=encode_callback("det", product['id']))],
+            *self._view_post_buttons(product),
+        ]
+        return caption, InlineKeyboardMarkup(keyboard)
+
+    def _render_listing(self, product, bot_username):
+        seller = product.seller
+        caption = (
+            f"🔔 <b>NEW LISTING: {html.escape(product['name'])}</b>\n\n"
+            f"💰 <b>Price:</b> {product.get('price', 0):.2f} ETB\n\n"
+            f"👤 <b>SELLER DETAILS:</b>\n"
+            f"<b>👤 @{html.escape(str(product.get('poster_username', 'Not provided')))}</b>\n"
+            f"📋 <b>Name:</b> {html.escape(str(seller.get('name', 'Not provided')))}\n"
+            f"📱 <b>Phone:</b> {html.escape(str(seller.get('phone', 'Not provided')))}\n"
+            f"📍 <b>Address:</b> {html.escape(str(seller.get('address', 'Not provided')))}\n\n"
+            f"⌛️ <b>Only one available!</b>"
+        )
+        keyboard = [
+            *self._view_post_buttons(product),
+            [InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")],
+        ]
+        return caption, InlineKeyboardMarkup(keyboard)
+
+    def _render_inline(self, product, bot_username):
+        category_info = html.escape(category_label(product, "\n"))
+        caption = (
+            f"📦 <b>{html.escape(product['name'])}</b>\n\n"
+            f"{category_info}"
+            f"💰 Price: {product['price']:.2f} ETB"
+        )
+        return caption, InlineKeyboardMarkup([[self._contact_button(product, bot_username)]])
+
+
+product_renderer = ProductRenderer(PRODUCT_RENDER_CACHE_SIZE)
+product_store.add_index(product_renderer)
+
+
+class SellerStats:
+    """Per-seller statistics, kept up to date incrementally.
+
+    As a ProductStore index it adds or subtracts a product's contribution
+    (total, posted, scheduled, time to post) whenever the product changes, so
+    reading a seller's numbers is a dict lookup. Detail views and contact
+    reveals are counted per product in PRODUCT_STATS_FILE, written behind
+    through storage_writer, and summed per seller the same way.
+    """
+
+    COUNTERS = ('total', 'posted', 'scheduled', 'views', 'contact_reveals', 'post_delay_total', 'post_delay_count')
+
+    def __init__(self):
+        self._sellers = {}  # poster_id -> {counter: value}
+        self._events = {}  # product_id -> [views, contact_reveals]
+
+    def load(self):
+        """Load the per-product event counts from disk."""
+        if os.path.exists(PRODUCT_STATS_FILE):
+            with open(PRODUCT_STATS_FILE, 'r') as f:
+                self._events = {product_id: list(counts) for product_id, counts in json.load(f).items()}
+        if product_store.loaded:
+            self.rebuild(product_store.all())
+
+    def _save(self):
+        storage_writer.mark_dirty(PRODUCT_STATS_FILE, lambda: {k: list(v) for k, v in self._events.items()})
+
+    @staticmethod
+    def _post_delay(product):
+        """Seconds from being added to being posted, or None if unknown."""
+        if not product.get('posted', False) or not product.get('post_date') or not product.get('date_added'):
+            return None
+        try:
+            added = datetime.strptime(product['date_added'], "%Y-%m-%d %H:%M:%S")
+            posted = datetime.strptime(product['post_date'], "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+        return max((posted - added).total_seconds(), 0)
+
+    def _apply(self, product, sign):
+        stats = self._sellers.get(product.get('poster_id'))
+        if stats is None:
+            stats = self._sellers[product.get('poster_id')] = dict.fromkeys(self.COUNTERS, 0)
+        posted = product.get('posted', False)
+        stats['total'] += sign
+        if posted:
+            stats['posted'] += sign
+        elif product.get('scheduled_time'):
+            stats['scheduled'] += sign
+        delay = self._post_delay(product)
+        if delay is not None:
+            stats['post_delay_total'] += sign * delay
+            stats['post_delay_count'] += sign
+        views, contact_reveals = self._events.get(product['id'], (0, 0))
+        stats['views'] += sign * views
+        stats['contact_reveals'] += sign * contact_reveals
+
+    def rebuild(self, products):
+        self._sellers.clear()
+        known = set()
+        for product in products:
+            known.add(product['id'])
+            self._apply(product, 1)
+        # Forget counts of products deleted while the stats file was behind
+        self._events = {product_id: counts for product_id, counts in self._events.items() if product_id in known}
+
+    def add(self, product):
+        self._apply(product, 1)
+
+    def replace(self, old, new):
+        self._apply(old, -1)
+        self._apply(new, 1)
+
+    def remove(self, product):
+        self._apply(product, -1)
+        if self._events.pop(product['id'], None) is not None:
+            self._save()
+
+    def _record(self, product, viewer_id, slot, counter):
+        # Sellers looking at their own listings don't count
+        if viewer_id == product.get('poster_id'):
+            return
+        self._events.setdefault(product['id'], [0, 0])[slot] += 1
+        stats = self._sellers.get(product.get('poster_id'))
+        if stats is not None:
+            stats[counter] += 1
+        self._save()
+
+    def record_view(self, product, viewer_id):
+        """Count a buyer opening a product's details."""
+        self._record(product, viewer_id, 0, 'views')
+
+    def record_contact_reveal(self, product, viewer_id):
+        """Count a buyer being shown the seller's contact details."""
+        self._record(product, viewer_id, 1, 'contact_reveals')
+
+    def get(self, poster_id):
+        """Return a seller's counters, all zero for sellers without products."""
+        stats = self._sellers.get(poster_id)
+        return dict(stats) if stats is not None else dict.fromkeys(self.COUNTERS, 0)
+
+
+seller_stats = SellerStats()
+product_store.add_index(seller_stats)
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average and up to `burst` back to back."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available, 0 if one is available now."""
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self, cost=1):
+        """Take cost tokens, going into debt if needed; return how long the caller must wait."""
+        self._refill()
+        self.tokens -= cost
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds):
+        """Drain the bucket so the next request waits at least seconds."""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    @property
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.burst
+
+
+def retry_after_seconds(error):
+    """Seconds a RetryAfter error asks to wait (PTB may report them as a timedelta)."""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return retry_after
+
+
+class OutboundDispatcher(BaseRateLimiter):
+    """Rate limiter every Bot API request goes through.
+
+    Requests that target a chat take a token from that chat's bucket (the
+    stricter channel bucket for CHANNEL_ID) and then from the global bucket.
+    Requests waiting for a global token are served by lane, see OUTBOUND_LANES,
+    so a backlog of channel posts never delays a reply to a user. The lane is
+    passed as rate_limit_args, e.g. bot.send_photo(..., rate_limit_args='channel');
+    requests without one are interactive. A "retry after" answer pauses the
+    chat's bucket for the time Telegram asked for and retries the request.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST)
+        self._chats = {}  # chat_id -> TokenBucket
+        self._waiting = []  # heap of (lane priority, sequence) tickets for the global bucket
+        self._sequence = 0
+        self._changed = asyncio.Condition()
+        self.sent = dict.fromkeys(OUTBOUND_LANES, 0)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Drop buckets of chats that have been quiet long enough to be full again
+            if len(self._chats) > 1024:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            if str(chat_id) == CHANNEL_ID:
+                bucket = TokenBucket(OUTBOUND_CHANNEL_RATE, OUTBOUND_CHANNEL_BURST)
+            else:
+                bucket = TokenBucket(OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire_global(self, priority, cost):
+        async with self._changed:
+            ticket = (priority, self._sequence)
+            self._sequence += 1
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        delay = self._global.delay()
+                        if not delay:
+                            self._global.reserve(cost)
+                            return
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), delay)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._changed.wait()
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._changed.notify_all()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # Callback and inline answers, polling and the like aren't messages to a chat
+            return await callback(*args, **kwargs)
+
+        lane = rate_limit_args or 'interactive'
+        if lane not in OUTBOUND_LANES:
+            logger.warning(f"Unknown outbound lane {lane!r} for {endpoint}, sending it as interactive")
+            lane = 'interactive'
+        # An album is one request but counts as one message per photo; edit_message_media
+        # passes a single InputMedia object
+        media = data.get('media')
+        cost = max(len(media), 1) if isinstance(media, (list, tuple)) else 1
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            delay = bucket.reserve(cost)
+            if delay:
+                await asyncio.sleep(delay)
+            await self._acquire_global(OUTBOUND_LANES[lane], cost)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = retry_after_seconds(e)
+                logger.warning(f"Flood limit hit sending {endpoint} to {chat_id}, retrying in {retry_after}s")
+                bucket.pause(retry_after)
+                if attempt == OUTBOUND_MAX_RETRIES:
+                    raise
+                continue
+            self.sent[lane] += 1
+            return result
+
+
+outbound_dispatcher = OutboundDispatcher()
+
+
+class PostOutcomeUnknown(Exception):
+    """A channel post may or may not have been published, so it must not be sent again automatically."""
+
+
+def classify_send_error(error):
+    """Return (kind, retry_after) for a failed send; see DELIVERY_RETRYABLE for the kinds worth retrying."""
+    if isinstance(error, PostOutcomeUnknown):
+        return 'unknown', 0
+    if isinstance(error, RetryAfter):
+        return 'flood', retry_after_seconds(error)
+    if isinstance(error, Forbidden):
+        return 'forbidden', 0
+    # BadRequest is a NetworkError subclass, so it has to be checked first
+    if isinstance(error, BadRequest):
+        return 'bad_request', 0
+    if isinstance(error, NetworkError):
+        return ('connect' if request_never_sent(error) else 'network'), 0
+    return 'error', 0
+
+
+def request_never_sent(error):
+    """True if the request failed before reaching Telegram (no connection was made or none was free)."""
+    return isinstance(error.__cause__, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+# Only failures that prove nothing was published are retried: flood limits and
+# requests that never got a connection. A read timeout or a dropped connection
+# may have reached the channel and is parked as 'unknown' instead
+DELIVERY_RETRYABLE = {'flood', 'connect'}
+
+
+class ChannelOutbox:
+    """Durable record of channel posts, so a crash never leads to posting a product twice.
+
+    Before a product is sent to the channel a 'pending' record is appended to
+    OUTBOX_FILE (fsynced, like the product journal), and the outcome follows:
+    'sent' with the channel message id, 'failed' when Telegram refused the
+    request or no connection could be made, or 'unknown' when the response
+    timed out or the connection dropped and the photo may have been published
+    anyway. The product id is the
+    idempotency key: a product with a 'sent' record is never sent again, and
+    one with an 'unknown' record only after /redrive.
+
+    On startup reconcile() replays the records. A 'sent' record whose product
+    is still unposted (the crash came before the catalog was saved) is applied
+    to the catalog. A 'pending' record without an outcome means the process
+    died mid-send and the post may or may not be in the channel; it becomes
+    'unknown' and goes to the dead-letter queue instead of being retried, and
+    /redrive releases it once an admin has checked the channel.
+
+    'sent' records are dropped by compact() once the posted flag they
+    guard has been saved with the catalog.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}  # product_id -> latest unresolved or 'sent' record
+        self._file = None
+
+    def load(self):
+        """Read the outbox, keeping the latest record per product."""
+        self._entries = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append
+                    logger.warning(f"Skipping unreadable outbox record in {self.path}")
+                    continue
+                self._track(record)
+
+    def _track(self, record):
+        if record['state'] in ('failed', 'released'):
+            self._entries.pop(record['id'], None)
+        else:
+            self._entries[record['id']] = record
+
+    def get(self, product_id):
+        return self._entries.get(product_id)
+
+    def sent_ids(self):
+        """Return the ids of products with a 'sent' record."""
+        return {product_id for product_id, entry in self._entries.items() if entry['state'] == 'sent'}
+
+    def record(self, product_id, state, message_id=None):
+        """Append a record for a product and fsync it before returning."""
+        record = {'id': product_id, 'state': state, 'at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        if message_id is not None:
+            record['message_id'] = message_id
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._track(record)
+
+    def release(self, product_id):
+        """Allow an 'unknown' product to be posted again."""
+        if product_id in self._entries and self._entries[product_id]['state'] != 'sent':
+            self.record(product_id, 'released')
+
+    def reconcile(self):
+        """Settle the records left by the previous run; touches only products with records."""
+        recovered = unknown = 0
+        for product_id, entry in list(self._entries.items()):
+            product = product_store.get(product_id)
+            if product is None:
+                del self._entries[product_id]
+                continue
+            if entry['state'] == 'sent':
+                if not product.get('posted', False):
+                    product_store.update(
+                        product_id,
+                        posted=True,
+                        post_date=entry['at'],
+                        channel_message_id=entry['message_id']
+                    )
+                    recovered += 1
+            elif entry['state'] == 'pending':
+                self._entries[product_id] = dict(entry, state='unknown')
+                channel_delivery.park(
+                    product_id, product['name'], 'unknown',
+                    "The bot stopped while posting this product. Check the channel before re-driving it.", 1
+                )
+                unknown += 1
+        self.compact()
+        if recovered or unknown:
+            logger.info(f"Outbox: {recovered} finished posts recovered, {unknown} posts with unknown outcome")
+
+    def compact(self, settled=()):
+        """Rewrite the outbox, dropping the 'sent' records of products in settled (their posted flag is saved)."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._entries = {k: v for k, v in self._entries.items() if v['state'] != 'sent' or k not in settled}
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            for record in self._entries.values():
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+
+channel_outbox = ChannelOutbox(OUTBOX_FILE)
+
+
+async def send_channel_post(bot, product):
+    """Post a product to CHANNEL_ID through channel_outbox and mark it posted; return the channel message id."""
+    entry = channel_outbox.get(product['id'])
+    if entry is not None and entry['state'] == 'sent':
+        # Already in the channel, e.g. a retry racing a send that went through
+        message_id = entry['message_id']
+    elif entry is not None:
+        raise PostOutcomeUnknown("An earlier post of this product may already be in the channel")
+    else:
+        # The post date changes every time, so it stays outside the cached caption
+        caption, reply_markup = product_renderer.render(product, 'channel', bot_username=bot.username)
+
+        channel_outbox.record(product['id'], 'pending')
+        try:
+            message = await bot.send_photo(
+                chat_id=CHANNEL_ID,
+                photo=product['image_file_id'],
+                caption=f"{caption}📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+                reply_markup=reply_markup,
+                rate_limit_args='channel'
+            )
+        except (RetryAfter, Forbidden, BadRequest):
+            # Telegram refused the request, so nothing was published and it may be sent again
+            channel_outbox.record(product['id'], 'failed')
+            raise
+        except NetworkError as e:
+            if not request_never_sent(e):
+                # A read timeout or dropped connection may still have published the photo
+                channel_outbox.record(product['id'], 'unknown')
+                raise PostOutcomeUnknown(f"Telegram did not confirm the post, it may already be in the channel: {e}") from e
+            # The connection was never made, so nothing was published
+            channel_outbox.record(product['id'], 'failed')
+            raise
+        except Exception as e:
+            # Any other failure leaves the outcome of the send unknown
+            channel_outbox.record(product['id'], 'unknown')
+            raise PostOutcomeUnknown(f"Telegram did not confirm the post, it may already be in the channel: {e}") from e
+        message_id = message.message_id
+        channel_outbox.record(product['id'], 'sent', message_id)
+
+    # Update product status and store message ID
+    product_store.update(
+        product['id'],
+        posted=True,
+        post_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        channel_message_id=message_id
+    )
+    return message_id
+
+
+class ChannelDelivery:
+    """Posts products to the channel, retrying failures in the background.
+
+    A post that fails with a flood limit, or with a network error raised before
+    the request reached Telegram (no connection could be opened), is queued
+    for a retry with exponential backoff; a background task sends it again
+    when it is due. A read timeout or a dropped connection may have published
+    the post anyway, so it is parked as 'unknown' instead of being retried.
+    Permanent failures (the bot lacks rights, Telegram rejects the request)
+    and posts that still fail after DELIVERY_MAX_ATTEMPTS go to the
+    dead-letter queue in DEAD_LETTERS_FILE, which admins list with
+    /deadletters and send again with /redrive.
+    """
+
+    def __init__(self):
+        self._retries = []  # heap of (due time, product_id)
+        self._pending = {}  # product_id -> (failed attempts, due time) of its queued retry
+        self._dead = {}  # product_id -> {name, kind, error, attempts, failed_at}
+        self._bot = None
+        self._wakeup = None
+        self._task = None
+
+    def load(self):
+        """Load the dead-letter queue from disk."""
+        if os.path.exists(DEAD_LETTERS_FILE):
+            with open(DEAD_LETTERS_FILE, 'r') as f:
+                self._dead = json.load(f)
+
+    def _save(self):
+        storage_writer.mark_dirty(DEAD_LETTERS_FILE, lambda: dict(self._dead))
+
+    def start(self, bot):
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_pending(self, product_id):
+        """True if the product waits for a retry or sits in the dead-letter queue."""
+        return product_id in self._pending or product_id in self._dead
+
+    def dead_letters(self):
+        """Return (product_id, entry) pairs, oldest failure first."""
+        return sorted(self._dead.items(), key=lambda item: item[1]['failed_at'])
+
+    def redrive(self, product_ids=None):
+        """Move dead letters (all, or the given ids) back to the retry queue; return how many moved."""
+        if product_ids is None:
+            product_ids = list(self._dead)
+        moved = 0
+        for product_id in product_ids:
+            if self._dead.pop(product_id, None) is not None:
+                # An admin re-driving a post with unknown outcome has checked the channel
+                channel_outbox.release(product_id)
+                self._schedule(product_id, 0, 0)
+                moved += 1
+        if moved:
+            self._save()
+        return moved
+
+    def _schedule(self, product_id, attempts, delay):
+        due = time.monotonic() + delay
+        self._pending[product_id] = (attempts, due)
+        heapq.heappush(self._retries, (due, product_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def post(self, bot, product_id):
+        """Post a product now.
+
+        Returns (status, detail): ('posted', channel message id),
+        ('retrying', error text), ('unknown', error text) when the post may
+        already be in the channel, or ('failed', error text).
+        """
+        if product_id in self._pending:
+            return 'retrying', "A retry of this post is already queued."
+        return await self._attempt(bot, product_id, 1)
+
+    async def _attempt(self, bot, product_id, attempt):
+        product = product_store.get(product_id)
+        if not product:
+            self._pending.pop(product_id, None)
+            return 'failed', "Product not found."
+
+        try:
+            message_id = await send_channel_post(bot, product)
+        except Exception as e:
+            kind, retry_after = classify_send_error(e)
+            if kind in DELIVERY_RETRYABLE and attempt < DELIVERY_MAX_ATTEMPTS:
+                delay = max(retry_after, min(DELIVERY_BACKOFF_MAX, DELIVERY_BACKOFF_BASE * 2 ** (attempt - 1)))
+                logger.warning(f"Posting product {product_id} failed ({kind}: {e}), retry {attempt} in {delay:.0f}s")
+                self._schedule(product_id, attempt, delay)
+                return 'retrying', str(e)
+
+            logger.error(f"Posting product {product_id} failed ({kind}: {e}), moved to the dead-letter queue")
+            self.park(product_id, product['name'], kind, str(e), attempt)
+            return ('unknown' if kind == 'unknown' else 'failed'), str(e)
+
+        self._pending.pop(product_id, None)
+        if self._dead.pop(product_id, None) is not None:
+            self._save()
+        return 'posted', message_id
+
+    def park(self, product_id, name, kind, error, attempts):
+        """Put a product in the dead-letter queue."""
+        self._pending.pop(product_id, None)
+        self._dead[product_id] = {
+            'name': name,
+            'kind': kind,
+            'error': error,
+            'attempts': attempts,
+            'failed_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self._save()
+
+    async def _run(self):
+        while True:
+            if not self._retries:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            due, product_id = self._retries[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            heapq.heappop(self._retries)
+            attempts, pending_due = self._pending.get(product_id, (None, None))
+            if pending_due != due:
+                # Superseded by a newer retry (e.g. a re-drive), or no longer wanted
+                continue
+            product = product_store.get(product_id)
+            if product and product.get('posted', False):
+                self._pending.pop(product_id)
+                continue
+            try:
+                status, detail = await self._attempt(self._bot, product_id, attempts + 1)
+                if status == 'posted':
+                    logger.info(f"Posted product {product_id} after {attempts} failed attempt(s)")
+            except Exception as e:
+                logger.error(f"Error retrying post of product {product_id}: {e}")
+                self._pending.pop(product_id, None)
+
+
+channel_delivery = ChannelDelivery()
+
+
+class PostScheduler:
+    """Posts products at their scheduled_time.
+
+    As a ProductStore index it keeps every unposted product with a
+    scheduled_time in a min-heap of (due timestamp, product_id), rebuilt from
+    the catalog on load, so schedules survive restarts without job_queue jobs.
+    Rescheduled and removed products leave stale heap entries behind that are
+    skipped when popped. A single background task sleeps until the earliest
+    entry is due; overdue entries are handled by SCHEDULE_CATCH_UP_WINDOW.
+    """
+
+    def __init__(self):
+        self._heap = []  # (due timestamp, product_id), may hold stale entries
+        self._due = {}  # product_id -> due timestamp of its live heap entry
+        self._bot = None
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._due)
+
+    @staticmethod
+    def _due_time(product):
+        if product.get('posted', False) or not product.get('scheduled_time'):
+            return None
+        try:
+            # fromisoformat reads the stored "%Y-%m-%d %H:%M:%S" many times faster than strptime
+            return datetime.fromisoformat(product['scheduled_time']).timestamp()
+        except ValueError:
+            return None
+
+    def _push(self, product_id, due):
+        self._due[product_id] = due
+        heapq.heappush(self._heap, (due, product_id))
+        if self._wakeup is not None and self._heap[0][0] == due:
+            self._wakeup.set()
+
+    def _compact(self):
+        # Rebuild the heap once stale entries outnumber live ones
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(due, product_id) for product_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def rebuild(self, products):
+        self._due = {}
+        for product in products:
+            due = self._due_time(product)
+            if due is not None:
+                self._due[product['id']] = due
+        self._heap = [(due, product_id) for product_id, due in self._due.items()]
+        heapq.heapify(self._heap)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def add(self, product):
+        due = self._due_time(product)
+        if due is not None:
+            self._push(product['id'], due)
+
+    def replace(self, old, new):
+        due = self._due_time(new)
+        if due == self._due.get(new['id']):
+            return
+        self._due.pop(new['id'], None)
+        if due is not None:
+            self._push(new['id'], due)
+        self._compact()
+
+    def remove(self, product):
+        self._due.pop(product['id'], None)
+        self._compact()
+
+    def next_due(self):
+        """Return the earliest due timestamp, or None if nothing is scheduled."""
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return (product_id, due) for every entry due at or before now, earliest first."""
+        due_entries = []
+        while self._heap and self._heap[0][0] <= now:
+            due, product_id = heapq.heappop(self._heap)
+            if self._due.get(product_id) == due:
+                del self._due[product_id]
+                due_entries.append((product_id, due))
+        return due_entries
+
+    def start(self, bot):
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            for product_id, due in self.pop_due(now):
+                try:
+                    await self._fire(product_id, now - due)
+                except Exception as e:
+                    logger.error(f"Error posting scheduled product {product_id}: {e}")
+
+            next_due = self.next_due()
+            timeout = SCHEDULE_MAX_SLEEP if next_due is None else min(max(next_due - time.time(), 0), SCHEDULE_MAX_SLEEP)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _fire(self, product_id, lateness):
+        if channel_delivery.is_pending(product_id):
+            # Already being retried, or parked for an admin to re-drive
+            return
+        if lateness > SCHEDULE_CATCH_UP_WINDOW:
+            logger.warning(
+                f"Scheduled post of product {product_id} missed by {format_duration(lateness)}, "
+                f"returning it to the auto-post queue"
+            )
+            product_store.update(product_id, scheduled_time=None)
+            return
+        await post_scheduled_product(product_id, self._bot)
+
+
+post_scheduler = PostScheduler()
+product_store.add_index(post_scheduler)
+
+
+class AutoPostPlanner:
+    """Picks the next product to auto-post, taking turns between sellers.
+
+    As a ProductStore index it keeps a FIFO queue of auto-postable products
+    (unposted, not scheduled) per poster_id, and a ring of the sellers that
+    have products waiting. next_ready() takes the oldest product of the seller
+    at the head of the ring and moves that seller to the back, so someone who
+    lists fifty products gets one turn per round like everyone else. Products
+    that stop being postable are dropped when they reach the head of their
+    queue, and sellers with auto-post turned off leave the ring until resume(),
+    so each pick is amortized O(1).
+    """
+
+    def __init__(self):
+        self._queues = {}  # poster_id -> deque of product ids, oldest first
+        self._ready = {}  # product_id -> poster_id of products still waiting
+        self._ring = deque()  # poster ids with waiting products, next turn first
+        self._in_ring = set()
+
+    def __len__(self):
+        return len(self._ready)
+
+    @staticmethod
+    def _postable(product):
+        return not product.get('posted', False) and not product.get('scheduled_time')
+
+    def _enqueue(self, poster_id):
+        if poster_id not in self._in_ring:
+            self._in_ring.add(poster_id)
+            self._ring.append(poster_id)
+
+    def rebuild(self, products):
+        self._queues = {}
+        self._ready = {}
+        self._ring = deque()
+        self._in_ring = set()
+        for product in products:
+            self.add(product)
+
+    def add(self, product):
+        if not self._postable(product):
+            return
+        poster_id = product.get('poster_id')
+        self._ready[product['id']] = poster_id
+        self._queues.setdefault(poster_id, deque()).append(product['id'])
+        self._enqueue(poster_id)
+
+    def replace(self, old, new):
+        if new['id'] in self._ready:
+            if not self._postable(new):
+                del self._ready[new['id']]
+        else:
+            self.add(new)
+
+    def remove(self, product):
+        self._ready.pop(product['id'], None)
+
+    def resume(self, poster_id):
+        """Give a seller who turned auto-post back on their turns again."""
+        if self._queues.get(poster_id):
+            self._enqueue(poster_id)
+
+    def next_ready(self):
+        """Remove and return the id of the next product to auto-post, or None."""
+        while self._ring:
+            poster_id = self._ring.popleft()
+            self._in_ring.discard(poster_id)
+            queue = self._queues[poster_id]
+            while queue:
+                if queue[0] not in self._ready:
+                    queue.popleft()
+                elif channel_delivery.is_pending(queue[0]):
+                    # Owned by a retry or the dead-letter queue now; add() takes it back
+                    # if an update makes it postable again
+                    del self._ready[queue.popleft()]
+                else:
+                    break
+            if not queue:
+                del self._queues[poster_id]
+                continue
+            if poster_id and not get_user_preferences(poster_id).get('auto_post', True):
+                # Out of the ring until the seller turns auto-post back on
+                continue
+
+            product_id = queue.popleft()
+            del self._ready[product_id]
+            if queue:
+                self._enqueue(poster_id)
+            else:
+                del self._queues[poster_id]
+            return product_id
+        return None
+
+
+auto_post_planner = AutoPostPlanner()
+product_store.add_index(auto_post_planner)
+
+
+def format_duration(seconds):
+    """Format a duration as e.g. "2d 3h", "5h 10m" or "12m"."""
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
+
+
+def new_product_filter():
+    """Return an empty filter: every field None means "any"."""
+    return {'category': None, 'subcategory': None, 'low': None, 'high': None, 'status': None, 'days': None}
+
+
+def filter_products(product_filter):
+    """Apply a product filter. Returns (ids cheapest first, facet counts).
+
+    Each facet counts its options under all the other active filters, so the
+    counts say how many results picking that option would give.
+    """
+    category = product_filter['category']
+    subcategory = product_filter['subcategory'] if category else None
+    low, high = product_filter['low'], product_filter['high']
+    status = product_filter['status']
+    categories = list(product_store.category_counts())
+    subcategories = list(product_store.subcategory_counts(category)) if category else []
+
+    if product_filter['days'] is None:
+        # Everything is answered by bisecting the sorted price buckets
+        return price_index.range(status, category, subcategory, low, high), {
+            'categories': {name: price_index.count(status, name, None, low, high) for name in categories},
+            'subcategories': {name: price_index.count(status, category, name, low, high)
+                              for name in subcategories},
+            'bands': [price_index.count(status, category, subcategory, band_low, band_high)
+                      for band_low, band_high in PRICE_FILTER_BANDS],
+            'status': {option: price_index.count(option, category, subcategory, low, high)
+                       for option in (None, True, False)},
         }
-    preferences[user_id_str][key] = value
-    save_preferences(preferences)
+
+    # Products are appended as they are added, so the recent ones are a suffix of
+    # the catalog: walk back from the newest and count the facets in one pass
+    cutoff = (datetime.now() - timedelta(days=product_filter['days'])).strftime("%Y-%m-%d %H:%M:%S")
+    catalog = product_store.snapshot()
+    results = []
+    facets = {
+        'categories': dict.fromkeys(categories, 0),
+        'subcategories': dict.fromkeys(subcategories, 0),
+        'bands': [0] * len(PRICE_FILTER_BANDS),
+        'status': {None: 0, True: 0, False: 0},
+    }
+    for product_id in reversed(catalog.order):
+        product = catalog.get(product_id)
+        if product is None:
+            continue
+        date_added = product.get('date_added')
+        if not date_added:
+            continue
+        if date_added < cutoff:
+            break
+
+        price = PriceIndex._price(product)
+        posted = bool(product.get('posted', False))
+        product_category = product.get('category') or '#Other'
+        category_ok = category is None or product_category == category
+        subcategory_ok = subcategory is None or product.get('subcategory') == subcategory
+        price_ok = (low is None or price >= low) and (high is None or price < high)
+        status_ok = status is None or posted == status
+
+        if price_ok and status_ok:
+            if product_category in facets['categories']:
+                facets['categories'][product_category] += 1
+            if category_ok and product.get('subcategory') in facets['subcategories']:
+                facets['subcategories'][product['subcategory']] += 1
+        if category_ok and subcategory_ok and status_ok:
+            for band, (band_low, band_high) in enumerate(PRICE_FILTER_BANDS):
+                if (band_low is None or price >= band_low) and (band_high is None or price < band_high):
+                    facets['bands'][band] += 1
+                    break
+        if category_ok and subcategory_ok and price_ok:
+            facets['status'][None] += 1
+            facets['status'][posted] += 1
+            if status_ok:
+                results.append((price, product_id))
+
+    # Back to catalog order, so equal prices tie the same way as in the price buckets
+    results.reverse()
+    results.sort(key=itemgetter(0))
+    return [product_id for _, product_id in results], facets
 
 
 def get_main_menu_keyboard():
@@ -187,7 +2948,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Check if this is a deep link for contacting a seller
     if context.args and context.args[0].startswith("contact_"):
         # Extract product ID
-        product_id = context.args[0].split("_")[1]
+        product_id = context.args[0].partition("_")[2]
         logger.info(f"Deep link detected for product {product_id}")
 
         # Check if user is registered
@@ -366,9 +3127,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                                                                                      "🔍 <b>Explore Products</b> - Browse all products\n\n"
                                                                                      "<b>Other Commands:</b>\n"
                                                                                      "/start - Show the main menu\n"
-                                                                                     "/help - Show this help message\n\n"
+                                                                                     "/help - Show this help message\n"
+                                                                                     "/search &lt;words&gt; - Search products\n"
+                                                                                     "/filter [price range] - Filter products by price, category and status\n\n"
                                                                                      f"Auto-posting is {'enabled' if AUTO_POST_ENABLED else 'disabled'}.\n"
-                                                                                     f"Products are automatically posted every {AUTO_POST_INTERVAL} hours."
+                                                                                     f"{AUTO_POST_LIMIT} product(s) are automatically posted every {AUTO_POST_INTERVAL} hours, "
+                                                                                     f"taking turns between sellers."
     )
 
     await update.message.reply_html(help_text, reply_markup=get_main_menu_keyboard())
@@ -416,12 +3180,9 @@ async def handle_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 async def my_products(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Show user's products and options to manage them."""
     user_id = update.effective_user.id
-    products = load_products()
+    product_count = product_store.count_by_poster(user_id)
 
-    # Filter products by this user
-    user_products = [p for p in products if p.get('poster_id') == user_id]
-
-    if not user_products:
+    if not product_count:
         # No products, offer to add one
         keyboard = [
             [InlineKeyboardButton("➕ Add New Product", callback_data="add_product")],
@@ -444,17 +3205,49 @@ async def my_products(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         reply_markup = InlineKeyboardMarkup(keyboard)
 
         await update.message.reply_text(
-            f"You have {len(user_products)} products. What would you like to do?",
+            f"You have {product_count} products. What would you like to do?",
             reply_markup=reply_markup
         )
 
     return MAIN_MENU
 
 
+async def show_product_stats(query, context):
+    """Show the seller's product statistics."""
+    stats = seller_stats.get(query.from_user.id)
+
+    if stats['post_delay_count']:
+        time_to_post = format_duration(stats['post_delay_total'] / stats['post_delay_count'])
+    else:
+        time_to_post = "Not available yet"
+
+    message = (
+        f"📊 <b>Product Statistics</b>\n\n"
+        f"📦 Total Products: {stats['total']}\n"
+        f"✅ Posted: {stats['posted']}\n"
+        f"⏰ Scheduled: {stats['scheduled']}\n"
+        f"⏳ Not posted yet: {stats['total'] - stats['posted'] - stats['scheduled']}\n\n"
+        f"👁️ Detail Views: {stats['views']}\n"
+        f"📞 Contact Reveals: {stats['contact_reveals']}\n"
+        f"⏱ Average Time to Post: {time_to_post}"
+    )
+
+    keyboard = [
+        [InlineKeyboardButton("📋 List My Products", callback_data="list_my_products")],
+        [InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")]
+    ]
+
+    await query.message.reply_text(
+        message,
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode='HTML'
+    )
+    return MAIN_MENU
+
+
 async def my_account(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Show user account information."""
     user = update.effective_user
-    products = load_products()
 
     # Get user registration data
     user_data = get_user_data(user.id)
@@ -466,10 +3259,8 @@ async def my_account(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
         return MAIN_MENU
 
-    # Filter products by this user
-    user_products = [p for p in products if p.get('poster_id') == user.id]
-    posted_count = sum(1 for p in user_products if p.get('posted', False))
-    scheduled_count = sum(1 for p in user_products if p.get('scheduled_time') and not p.get('posted', False))
+    # Products listed by this user
+    stats = seller_stats.get(user.id)
 
     # Get user preferences
     prefs = get_user_preferences(user.id)
@@ -486,9 +3277,9 @@ async def my_account(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         f"User ID: {user.id}\n"
         f"Admin: {admin_status}\n\n"
         f"<b>Your Activity:</b>\n"
-        f"Total Products: {len(user_products)}\n"
-        f"Posted Products: {posted_count}\n"
-        f"Scheduled Products: {scheduled_count}\n\n"
+        f"Total Products: {stats['total']}\n"
+        f"Posted Products: {stats['posted']}\n"
+        f"Scheduled Products: {stats['scheduled']}\n\n"
         f"<b>Preferences:</b>\n"
         f"Auto-post: {'✅ Enabled' if prefs.get('auto_post', True) else '❌ Disabled'}\n"
         f"Notifications: {'✅ Enabled' if prefs.get('notifications', True) else '❌ Disabled'}\n"
@@ -541,10 +3332,9 @@ async def preferences(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 async def schedule_post_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Show menu for scheduling posts."""
     user_id = update.effective_user.id
-    products = load_products()
 
-    # Filter unposted products by this user
-    user_products = [p for p in products if p.get('poster_id') == user_id and not p.get('posted', False)]
+    # Unposted products by this user
+    user_products = [p for p in product_store.by_poster(user_id) if not p.get('posted', False)]
 
     if not user_products:
         # No products to schedule
@@ -565,7 +3355,7 @@ async def schedule_post_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
             scheduled = f" ⏰ {product['scheduled_time']}" if product.get('scheduled_time') else ""
             keyboard.append([InlineKeyboardButton(
                 f"{product['name']}{scheduled}",
-                callback_data=f"schedule_{product['id']}"
+                callback_data=encode_callback("sch", product['id'])
             )])
 
         keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")])
@@ -609,7 +3399,8 @@ async def handle_contact_message(update: Update, context: ContextTypes.DEFAULT_T
             text=f"📩 <b>New Contact Message</b>\n\n"
                  f"From: {user_info}\n\n"
                  f"Message:\n{message}",
-            parse_mode='HTML'
+            parse_mode='HTML',
+            rate_limit_args='notification'
         )
 
         # Confirm to user
@@ -632,9 +3423,10 @@ async def handle_contact_message(update: Update, context: ContextTypes.DEFAULT_T
 
 async def explore_products(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Show all products for exploration."""
-    products = load_products()
+    # The snapshot's id tuple is immutable, so the cursor shares it instead of copying
+    product_ids = product_store.snapshot().order
 
-    if not products:
+    if not product_ids:
         await update.message.reply_text(
             "No products available to explore yet.",
             reply_markup=get_main_menu_keyboard()
@@ -642,83 +3434,461 @@ async def explore_products(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return MAIN_MENU
 
     # Show the first few products with navigation
-    await show_product_page(update, context, products, 0)
+    cursor = result_cursors.open(update.effective_user.id, product_ids)
+    await show_product_page(update, context, product_ids, 0, page_args=(cursor,))
     return MAIN_MENU
 
 
-async def show_product_page(update: Update, context: ContextTypes.DEFAULT_TYPE, products, page=0, items_per_page=3):
-    """Show a paginated view of products."""
-    start_idx = page * items_per_page
-    end_idx = min(start_idx + items_per_page, len(products))
-    current_products = products[start_idx:end_idx]
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Search products by name, description and category: /search <words>."""
+    text = " ".join(context.args)
+    if not search_tokens(text):
+        await update.message.reply_text(
+            "Usage: /search <words>\nFor example: /search samsung phone",
+            reply_markup=get_main_menu_keyboard()
+        )
+        return
 
-    for product in current_products:
-        # Create inline keyboard for each product
-        keyboard = []
-        # Add Contact Seller button if seller has a username
-        if product.get('poster_username'):
-            keyboard.append([InlineKeyboardButton("📞 Contact Seller",
-                                                  url=f"https://t.me/{product.get('poster_username')}")])
-        else:
-            # Fallback to deep link if no username
-            keyboard.append([InlineKeyboardButton("📞 Contact Seller",
-                                                  url=f"https://t.me/{context.bot.username}?start=item_{product['id']}")])
-        keyboard.append([InlineKeyboardButton("📋 Product Details", callback_data=f"product_details_{product['id']}")])
+    product_ids = search_index.search(text)
+    if not product_ids:
+        await update.message.reply_text(
+            f"No products found for \"{text}\".",
+            reply_markup=get_main_menu_keyboard()
+        )
+        return
 
-        # Add View Post button if the product has been posted and has a message_id
-        if product.get('posted', False) and product.get('channel_message_id'):
-            keyboard.append([InlineKeyboardButton("👁️ View Post",
-                                                  url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{product['channel_message_id']}")])
+    cursor = result_cursors.open(update.effective_user.id, product_ids)
+    await show_product_page(update, context, product_ids, 0, page_args=(cursor,))
 
-        reply_markup = InlineKeyboardMarkup(keyboard)
 
-        # Status indicator
-        if product.get('scheduled_time'):
-            status = f"⏰ Scheduled for {product['scheduled_time']}"
-        elif product.get('posted', False):
-            status = "✅ Posted"
-        else:
-            status = "⏳ Not posted yet"
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answer inline queries (@bot phone) with product photos from the in-memory index."""
+    inline_query = update.inline_query
+    product_ids = inline_query_cache.get(inline_query.query)
 
-        # Show category and subcategory if available
-        category_info = ""
-        if product.get('category'):
-            category_info = f"{product.get('category')}"
-            if product.get('subcategory'):
-                category_info += f" - {product.get('subcategory')}"
-            category_info += "\n"
+    try:
+        offset = int(inline_query.offset or 0)
+    except ValueError:
+        offset = 0
+    catalog = product_store.snapshot()
+    page_ids = product_ids[offset:offset + INLINE_RESULTS_PER_PAGE]
+
+    results = []
+    for product in map(catalog.get, page_ids):
+        # Inline photo results can only reuse a photo Telegram already has
+        if product is None or not product.get('image_file_id'):
+            continue
+
+        caption, reply_markup = product_renderer.render(product, 'inline', context.bot.username)
+        results.append(InlineQueryResultCachedPhoto(
+            id=product['id'],
+            photo_file_id=product['image_file_id'],
+            title=product['name'],
+            description=f"💰 {product['price']:.2f} ETB  {category_label(product)}",
+            caption=caption,
+            parse_mode='HTML',
+            reply_markup=reply_markup
+        ))
 
-        await update.message.reply_photo(
-            photo=product['image_file_id'],
-            caption=f"📦 <b>{product['name']}</b>\n\n"
-                    f"{category_info}"
-                    f"💰 Price: {product['price']:.2f} ETB\n"
-                    f"Status: {status}",
-            reply_markup=reply_markup,
-            parse_mode='HTML'
-        )
+    next_offset = offset + INLINE_RESULTS_PER_PAGE
+    await inline_query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME,
+        next_offset=str(next_offset) if next_offset < len(product_ids) else ""
+    )
 
-    # Navigation buttons
+
+async def show_product_page(update: Update, context: ContextTypes.DEFAULT_TYPE, product_ids, page=0,
+                            items_per_page=3, page_action="page", page_args=(), edit=False):
+    """Show a paginated view of products.
+
+    product_ids is an ordered sequence of ids; only the current page is resolved.
+    Navigation buttons call back with encode_callback(page_action, *page_args, page).
+    With edit=True, update is the callback query of a tap and the page replaces the
+    tapped one in place when it has the same shape, otherwise the tapped message is deleted.
+    """
+    catalog = product_store.snapshot()
+    start_idx = page * items_per_page
+    end_idx = min(start_idx + items_per_page, len(product_ids))
+    current_products = [p for p in map(catalog.get, product_ids[start_idx:end_idx]) if p is not None]
+
+    cards = []
+    for product in current_products:
+        caption, reply_markup = product_renderer.render(product, 'card', context.bot.username)
+        cards.append((product, caption, reply_markup))
+
+    album = PRODUCT_LIST_RENDER_MODE == 'album' and len(cards) >= 2
+    if album:
+        # Album captions are numbered to match the compact buttons below
+        cards = [(product, f"{number}. {caption}", reply_markup)
+                 for number, (product, caption, reply_markup) in enumerate(cards, start=1)]
+
+    nav_keyboard = []
+    if album:
+        # Per-product buttons move to the keyboard message below the album
+        for number, (product, _, reply_markup) in enumerate(cards, start=1):
+            nav_keyboard.append(compact_product_buttons(number, reply_markup))
     has_prev = page > 0
-    has_next = end_idx < len(products)
+    has_next = end_idx < len(product_ids)
 
     nav_buttons = []
     if has_prev:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"page_{page - 1}"))
+        nav_buttons.append(InlineKeyboardButton("⬅️ Previous",
+                                                callback_data=encode_callback(page_action, *page_args, page - 1)))
     if has_next:
-        nav_buttons.append(InlineKeyboardButton("➡️ Next", callback_data=f"page_{page + 1}"))
+        nav_buttons.append(InlineKeyboardButton("➡️ Next",
+                                                callback_data=encode_callback(page_action, *page_args, page + 1)))
 
-    nav_keyboard = []
     if nav_buttons:
         nav_keyboard.append(nav_buttons)
+    nav_keyboard.append([InlineKeyboardButton("🗂 Browse by Category", callback_data="browse"),
+                         InlineKeyboardButton("🎚 Filter", callback_data="filter")])
     nav_keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")])
 
     nav_markup = InlineKeyboardMarkup(nav_keyboard)
+    nav_text = f"Showing products {start_idx + 1}-{end_idx} of {len(product_ids)}"
 
-    await update.message.reply_text(
-        f"Showing products {start_idx + 1}-{end_idx} of {len(products)}",
-        reply_markup=nav_markup
+    if edit:
+        if await edit_product_page(update, context, cards, album, nav_text, nav_markup):
+            return
+        try:
+            await update.message.delete()
+        except Exception as e:
+            logger.error(f"Error deleting message: {e}")
+
+    if album:
+        item_messages = await update.message.reply_media_group(media=[
+            InputMediaPhoto(media=product['image_file_id'], caption=caption, parse_mode='HTML')
+            for product, caption, _ in cards
+        ])
+    else:
+        item_messages = []
+        for product, caption, reply_markup in cards:
+            item_messages.append(await update.message.reply_photo(
+                photo=product['image_file_id'],
+                caption=caption,
+                reply_markup=reply_markup,
+                parse_mode='HTML'
+            ))
+
+    nav_message = await update.message.reply_text(nav_text, reply_markup=nav_markup)
+
+    # Remember which messages make up the page so the next tap can edit them in place
+    context.user_data['page_view'] = {
+        'nav': nav_message.message_id,
+        'items': [message.message_id for message in item_messages],
+        'album': album,
+    }
+
+
+async def edit_product_page(query, context, cards, album, nav_text, nav_markup):
+    """Swap the photos and captions of the page the user tapped. Returns False if it can't be edited."""
+    view = context.user_data.get('page_view')
+    if (not view or view['nav'] != query.message.message_id
+            or view['album'] != album or len(view['items']) != len(cards)):
+        return False
+
+    try:
+        for message_id, (product, caption, reply_markup) in zip(view['items'], cards):
+            await context.bot.edit_message_media(
+                chat_id=query.message.chat_id,
+                message_id=message_id,
+                media=InputMediaPhoto(media=product['image_file_id'], caption=caption, parse_mode='HTML'),
+                # Album members can't carry their own keyboard
+                reply_markup=None if album else reply_markup
+            )
+        await query.edit_message_text(nav_text, reply_markup=nav_markup)
+    except BadRequest as e:
+        if 'not modified' in str(e):
+            return True
+        logger.warning(f"Could not edit product page in place: {e}")
+        return False
+    return True
+
+
+async def edit_or_reply(query, text, reply_markup=None, parse_mode=None):
+    """Edit the tapped message in place, falling back to a new message when it can't be edited."""
+    message = query.message
+    if EDIT_IN_PLACE_NAVIGATION:
+        # Only inline keyboards can be attached by an edit
+        editable = reply_markup is None or isinstance(reply_markup, InlineKeyboardMarkup)
+        try:
+            if editable and not message.photo:
+                return await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+            if editable and len(text) <= CAPTION_LIMIT:
+                return await query.edit_message_caption(caption=text, reply_markup=reply_markup,
+                                                        parse_mode=parse_mode)
+        except BadRequest as e:
+            if 'not modified' in str(e):
+                return message
+            logger.warning(f"Could not edit message {message.message_id} in place: {e}")
+
+        # The tapped message was kept for editing, so remove it before replying
+        try:
+            await message.delete()
+        except Exception as e:
+            logger.error(f"Error deleting message: {e}")
+
+    return await message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+
+
+def compact_product_buttons(number, reply_markup):
+    """Fold a product's own keyboard into one row of short, numbered buttons for album views."""
+    row = []
+    for button_row in reply_markup.inline_keyboard:
+        for button in button_row:
+            icon = button.text.split(' ', 1)[0]
+            row.append(InlineKeyboardButton(f"{icon} {number}", callback_data=button.callback_data, url=button.url))
+    return row
+
+
+def price_band_label(low, high):
+    """Describe a [low, high) price range in ETB."""
+    if low is None and high is None:
+        return "Any"
+    if low is None:
+        return f"Under {high:,.0f}"
+    if high is None:
+        return f"{low:,.0f}+"
+    return f"{low:,.0f}-{high:,.0f}"
+
+
+def parse_price_range(text):
+    """Parse "10000" (under 10,000) or "5000-10000" into (low, high). Returns None if invalid."""
+    match = re.fullmatch(r"\s*(?:(\d[\d,]*(?:\.\d+)?)\s*-\s*)?(\d[\d,]*(?:\.\d+)?)\s*", text)
+    if not match:
+        return None
+    low = float(match.group(1).replace(",", "")) if match.group(1) else None
+    high = float(match.group(2).replace(",", ""))
+    if low is not None and low >= high:
+        return None
+    return low, high
+
+
+async def filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Open the product filter panel: /filter, /filter 10000 or /filter 5000-10000."""
+    product_filter = new_product_filter()
+    if context.args:
+        price_range = parse_price_range(" ".join(context.args))
+        if price_range is None:
+            await update.message.reply_text(
+                "Usage: /filter [price range]\nFor example: /filter 10000 (under 10,000 ETB) or /filter 5000-10000",
+                reply_markup=get_main_menu_keyboard()
+            )
+            return
+        product_filter['low'], product_filter['high'] = price_range
+    context.user_data['product_filter'] = product_filter
+
+    text, reply_markup = render_filter_panel(product_filter)
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='HTML')
+
+
+def render_filter_panel(product_filter):
+    """Build the filter panel text and keyboard, with facet counts on every option."""
+    product_ids, facets = filter_products(product_filter)
+    category = product_filter['category']
+    subcategory = product_filter['subcategory']
+
+    def mark(selected, label):
+        return f"✅ {label}" if selected else label
+
+    keyboard = []
+    if category is None:
+        buttons = [
+            InlineKeyboardButton(f"{name} ({count})", callback_data=encode_callback("flt", "c", product_store.tag_key(name)))
+            for name, count in facets['categories'].items()
+        ]
+        keyboard.extend(buttons[i:i + 2] for i in range(0, len(buttons), 2))
+    else:
+        buttons = [InlineKeyboardButton(
+            mark(subcategory is None, f"All {category} ({facets['categories'].get(category, 0)})"),
+            callback_data=encode_callback("flt", "s", "")
+        )]
+        buttons.extend(
+            InlineKeyboardButton(mark(name == subcategory, f"{name} ({count})"),
+                                 callback_data=encode_callback("flt", "s", product_store.tag_key(name)))
+            for name, count in facets['subcategories'].items()
+        )
+        keyboard.extend(buttons[i:i + 2] for i in range(0, len(buttons), 2))
+        keyboard.append([InlineKeyboardButton("⬅️ All categories", callback_data=encode_callback("flt", "c", ""))])
+
+    price = (product_filter['low'], product_filter['high'])
+    buttons = []
+    for band, (band_low, band_high) in enumerate(PRICE_FILTER_BANDS):
+        selected = price == (band_low, band_high)
+        buttons.append(InlineKeyboardButton(
+            mark(selected, f"{price_band_label(band_low, band_high)} ({facets['bands'][band]})"),
+            # Tapping the selected band clears it
+            callback_data=encode_callback("flt", "p", "" if selected else band)
+        ))
+    keyboard.extend(buttons[i:i + 2] for i in range(0, len(buttons), 2))
+
+    status_labels = {None: "Any", True: "Posted", False: "Not posted"}
+    status_codes = {None: "", True: "p", False: "u"}
+    keyboard.append([
+        InlineKeyboardButton(mark(product_filter['status'] == option, f"{label} ({facets['status'][option]})"),
+                             callback_data=encode_callback("flt", "st", status_codes[option]))
+        for option, label in status_labels.items()
+    ])
+
+    days_labels = {None: "Any time", **{days: f"{days}d" for days in ADDED_FILTER_DAYS}}
+    keyboard.append([
+        InlineKeyboardButton(mark(product_filter['days'] == days, label),
+                             callback_data=encode_callback("flt", "d", "" if days is None else days))
+        for days, label in days_labels.items()
+    ])
+
+    keyboard.append([
+        InlineKeyboardButton(f"🔍 Show {len(product_ids)} results", callback_data="fshow"),
+        InlineKeyboardButton("♻️ Reset", callback_data="freset"),
+    ])
+    keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")])
+
+    if category is None:
+        category_text = "All"
+    else:
+        category_text = f"{category} › {subcategory}" if subcategory else category
+    text = (
+        "🎚 <b>Filter Products</b>\n\n"
+        f"Category: {category_text}\n"
+        f"Price: {price_band_label(*price)}{' ETB' if price != (None, None) else ''}\n"
+        f"Status: {status_labels[product_filter['status']]}\n"
+        f"Added: {days_labels.get(product_filter['days'], 'Any time')}\n\n"
+        f"<b>{len(product_ids)}</b> matching products"
+    )
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def show_filter_panel(query, context):
+    """Show the filter panel for the user's current filter."""
+    text, reply_markup = render_filter_panel(context.user_data['product_filter'])
+    await edit_or_reply(query, text, reply_markup=reply_markup, parse_mode='HTML')
+    return MAIN_MENU
+
+
+async def update_product_filter(query, context, field, value):
+    """Change one field of the user's filter from a panel button and redraw the panel."""
+    product_filter = context.user_data.setdefault('product_filter', new_product_filter())
+    if field == "c":
+        product_filter['category'] = product_store.tag_name(value) if value else None
+        product_filter['subcategory'] = None
+    elif field == "s":
+        product_filter['subcategory'] = product_store.tag_name(value) if value else None
+    elif field == "p":
+        band_low, band_high = PRICE_FILTER_BANDS[int(value)] if value else (None, None)
+        product_filter['low'], product_filter['high'] = band_low, band_high
+    elif field == "st":
+        product_filter['status'] = {"p": True, "u": False}.get(value)
+    elif field == "d":
+        product_filter['days'] = int(value) if value else None
+    return await show_filter_panel(query, context)
+
+
+async def show_filtered_products(query, context):
+    """Show the first page of the products matching the user's filter."""
+    product_filter = context.user_data.setdefault('product_filter', new_product_filter())
+    product_ids, _ = filter_products(product_filter)
+
+    if not product_ids:
+        await edit_or_reply(
+            query,
+            "No products match these filters.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🎚 Change Filters", callback_data="filter")]
+            ])
+        )
+        return MAIN_MENU
+
+    cursor = result_cursors.open(query.from_user.id, product_ids)
+    await show_product_page(query, context, product_ids, 0, page_args=(cursor,), edit=EDIT_IN_PLACE_NAVIGATION)
+    return MAIN_MENU
+
+
+async def browse_categories(query, context):
+    """Show categories with their live product counts."""
+    keyboard = []
+    for category, count in product_store.category_counts().items():
+        keyboard.append([InlineKeyboardButton(
+            f"{category} ({count})",
+            callback_data=encode_callback("bcat", product_store.tag_key(category))
+        )])
+    keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")])
+
+    await edit_or_reply(
+        query,
+        "🗂 <b>Browse by Category</b>\n\nSelect a category:",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode='HTML'
     )
+    return MAIN_MENU
+
+
+async def browse_subcategories(query, context, category_key):
+    """Show the subcategories of a category with their live product counts."""
+    category = product_store.tag_name(category_key)
+    if category is None:
+        return await browse_categories(query, context)
+
+    total = product_store.category_count(category)
+    keyboard = [[InlineKeyboardButton(
+        f"All in {category} ({total})",
+        callback_data=encode_callback("bpage", category_key, "")
+    )]]
+    for subcategory, count in product_store.subcategory_counts(category).items():
+        keyboard.append([InlineKeyboardButton(
+            f"{subcategory} ({count})",
+            callback_data=encode_callback("bpage", category_key, product_store.tag_key(subcategory))
+        )])
+    keyboard.append([InlineKeyboardButton("🔙 Back to Categories", callback_data="browse")])
+
+    await edit_or_reply(
+        query,
+        f"🗂 <b>{category}</b>\n\nSelect a subcategory:",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode='HTML'
+    )
+    return MAIN_MENU
+
+
+async def browse_category_page(query, context, category_key, subcategory_key):
+    """Show the first page of a category or subcategory, served straight from the category index."""
+    category = product_store.tag_name(category_key)
+    subcategory = product_store.tag_name(subcategory_key) if subcategory_key else None
+    product_ids = product_store.category_ids(category, subcategory) if category else []
+
+    if not product_ids:
+        await edit_or_reply(
+            query,
+            "No products in this category yet.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔙 Back to Categories", callback_data="browse")]
+            ])
+        )
+        return MAIN_MENU
+
+    cursor = result_cursors.open(query.from_user.id, product_ids)
+    await show_product_page(query, context, product_ids, 0, page_args=(cursor,), edit=EDIT_IN_PLACE_NAVIGATION)
+    return MAIN_MENU
+
+
+async def show_cursor_page(query, context, cursor, page):
+    """Show a page of a cached result list, starting a fresh explore list if it has expired."""
+    product_ids = result_cursors.get(query.from_user.id, cursor)
+    if product_ids is None:
+        product_ids = product_store.snapshot().order
+        if not product_ids:
+            await edit_or_reply(
+                query,
+                "No products available to explore yet.",
+                reply_markup=get_main_menu_keyboard()
+            )
+            return MAIN_MENU
+        await query.message.reply_text("These results have expired. Showing the latest products.")
+        cursor = result_cursors.open(query.from_user.id, product_ids)
+        page = 0
+
+    await show_product_page(query, context, product_ids, page, page_args=(cursor,), edit=EDIT_IN_PLACE_NAVIGATION)
+    return MAIN_MENU
 
 
 async def add_product_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -973,28 +4143,22 @@ async def product_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         username = user.username if user.username else user.first_name
         user_id = user.id
 
-        # Get user data
-        user_data = get_user_data(user_id)
-
-        # Save product data
-        product = {
-            'id': str(datetime.now().timestamp()),  # Unique ID based on timestamp
-            'name': context.user_data['product_name'],
-            'description': context.user_data['product_description'],
-            'price': context.user_data['product_price'],
-            'category': context.user_data.get('product_category', '#Other'),
-            'subcategory': context.user_data.get('product_subcategory', ''),
-            'image_file_id': file_id,
-            'date_added': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'posted': False,
-            'poster_username': username,
-            'poster_id': user_id,
-            'poster_name': user_data.get('name', ''),
-            'poster_phone': user_data.get('phone', ''),
-            'poster_address': user_data.get('address', ''),
-            'scheduled_time': None,
-            'channel_message_id': None  # Store the message ID when posted to channel
-        }
+        # Save product data; seller details are looked up from the user record when needed
+        product = Product(
+            id=product_ids.next_id(),
+            name=context.user_data['product_name'],
+            description=context.user_data['product_description'],
+            price=context.user_data['product_price'],
+            category=context.user_data.get('product_category', '#Other'),
+            subcategory=context.user_data.get('product_subcategory', ''),
+            image_file_id=file_id,
+            date_added=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            posted=False,
+            poster_username=username,
+            poster_id=user_id,
+            scheduled_time=None,
+            channel_message_id=None  # Store the message ID when posted to channel
+        )
 
         # Store in context for scheduling
         context.user_data['product'] = product
@@ -1045,9 +4209,7 @@ async def handle_scheduling(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if query.data == "schedule_now":
         # Save the product
         product = context.user_data['product']
-        products = load_products()
-        products.append(product)
-        save_products(products)
+        product_store.add(product)
 
         # Post immediately
         post_result = await post_product_by_id(context, product['id'])
@@ -1083,6 +4245,8 @@ async def handle_scheduling(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return MAIN_MENU
 
     elif query.data == "schedule_later":
+        # The time entered next is for the new product, not one picked earlier from the menu
+        context.user_data.pop('scheduling_product_id', None)
         await query.message.reply_text(
             "When would you like to schedule this post? Please enter date and time in format:\n"
             "YYYY-MM-DD HH:MM\n\n"
@@ -1094,9 +4258,7 @@ async def handle_scheduling(update: Update, context: ContextTypes.DEFAULT_TYPE)
     elif query.data == "save_only":
         # Just save the product without posting
         product = context.user_data['product']
-        products = load_products()
-        products.append(product)
-        save_products(products)
+        product_store.add(product)
 
         await query.message.reply_text(
             f"✅ Product '{product['name']}' has been saved to your products."
@@ -1137,20 +4299,25 @@ async def schedule_post(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
             )
             return SCHEDULE_POST
 
-        # Save the product with scheduled time
-        product = context.user_data['product']
-        product['scheduled_time'] = scheduled_time.strftime("%Y-%m-%d %H:%M:%S")
-
-        products = load_products()
-        products.append(product)
-        save_products(products)
-
-        # Schedule the post using the application's job queue
-        context.job_queue.run_once(
-            lambda ctx: post_scheduled_product(product['id'], ctx.bot),
-            scheduled_time,
-            name=f"scheduled_{product['id']}"
-        )
+        # post_scheduler picks the time up from the product store
+        scheduling_product_id = context.user_data.pop('scheduling_product_id', None)
+        if scheduling_product_id:
+            # Scheduling an existing product from the Schedule Post menu
+            product = product_store.update(
+                scheduling_product_id,
+                scheduled_time=scheduled_time.strftime("%Y-%m-%d %H:%M:%S")
+            )
+            if not product:
+                await update.message.reply_text(
+                    "Product not found.",
+                    reply_markup=get_main_menu_keyboard()
+                )
+                return MAIN_MENU
+        else:
+            # Save the new product with scheduled time
+            product = context.user_data['product']
+            product['scheduled_time'] = scheduled_time.strftime("%Y-%m-%d %H:%M:%S")
+            product_store.add(product)
 
         await update.message.reply_text(
             f"✅ Product '{product['name']}' has been scheduled for posting on:\n"
@@ -1171,67 +4338,14 @@ async def schedule_post(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
 async def post_scheduled_product(product_id, bot):
     """Post a scheduled product."""
-    products = load_products()
-
-    # Find the product
-    product = None
-    for p in products:
-        if p.get('id') == product_id:
-            product = p
-            break
-
-    if not product:
-        logger.error(f"Scheduled product {product_id} not found")
-        return
-
-    try:
-        # Create inline keyboard with contact seller button
-        keyboard = []
-        if product.get('poster_username'):
-            keyboard.append([InlineKeyboardButton("📞 Contact Seller",
-                                                  url=f"https://t.me/{product.get('poster_username')}")])
-        else:
-            # Fallback to deep link if no username
-            keyboard.append([InlineKeyboardButton("📞 Contact Seller",
-                                                  url=f"https://t.me/{bot.username}?start=item_{product_id}")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        # Format category info
-        category_info = ""
-        if product.get('category'):
-            category_info = f"{product.get('category')}"
-            if product.get('subcategory'):
-                category_info += f" - {product.get('subcategory')}"
-            category_info += "\n\n"
-
-        # Post to channel
-        message = await bot.send_photo(
-            chat_id=CHANNEL_ID,
-            photo=product['image_file_id'],
-            caption=f"🆕 NEW PRODUCT 🆕\n\n"
-                    f"📌 {product['name']}\n\n"
-                    f"{category_info}"
-                    f"📝 {product['description']}\n\n"
-                    f"💰 Price: {product['price']:.2f} ETB\n\n"
-                    f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-            reply_markup=reply_markup
-        )
-
-        # Update product status and store message ID
-        for p in products:
-            if p.get('id') == product_id:
-                p['posted'] = True
-                p['post_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                p['channel_message_id'] = message.message_id
-                break
-
-        save_products(products)
-        posted_products.add(product_id)
+    status, detail = await channel_delivery.post(bot, product_id)
 
-        logger.info(f"Scheduled product '{product['name']}' posted successfully")
-
-    except Exception as e:
-        logger.error(f"Error posting scheduled product: {e}")
+    if status == 'posted':
+        logger.info(f"Scheduled product {product_id} posted successfully")
+    elif status == 'retrying':
+        logger.warning(f"Scheduled product {product_id} not posted yet, retrying: {detail}")
+    else:
+        logger.error(f"Error posting scheduled product {product_id}: {detail}")
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -1244,198 +4358,149 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handle button callbacks."""
+    """Handle button callbacks by dispatching them through callback_router."""
     query = update.callback_query
     await query.answer()
 
-    # Delete the original message with inline keyboard
-    try:
-        await query.message.delete()
-    except Exception as e:
-        logger.error(f"Error deleting message: {e}")
+    route, args = callback_router.resolve(query.data)
+
+    # Delete the original message with inline keyboard, unless the route edits it in place
+    if not (EDIT_IN_PLACE_NAVIGATION and route is not None and route.edits_in_place):
+        try:
+            await query.message.delete()
+        except Exception as e:
+            logger.error(f"Error deleting message: {e}")
 
-    # Main menu navigation
-    if query.data == "back_to_main":
+    if route is None:
+        logger.warning(f"No callback route for {query.data!r}")
         await query.message.reply_text(
-            "Main Menu:",
+            "This button is no longer available.",
             reply_markup=get_main_menu_keyboard()
         )
         return MAIN_MENU
 
-    # Product management
-    elif query.data == "add_product":
-        return await add_product_start(query, context)
+    state = await route.handler(update if route.pass_update else query, context, *args)
+    return MAIN_MENU if state is None else state
 
-    elif query.data == "cancel_add_product":
-        await query.message.reply_text(
-            "Product addition cancelled.",
-            reply_markup=get_main_menu_keyboard()
-        )
-        return MAIN_MENU
 
-    elif query.data == "list_my_products":
-        return await list_user_products(query, context)
+async def back_to_main_menu(query, context):
+    """Return to the main menu."""
+    await query.message.reply_text(
+        "Main Menu:",
+        reply_markup=get_main_menu_keyboard()
+    )
+    return MAIN_MENU
 
-    # Category and subcategory selection
-    elif query.data.startswith("category_") or query.data == "custom_category" or query.data == "back_to_categories":
-        return await select_product_category(update, context)
 
-    elif query.data.startswith("subcategory_") or query.data == "custom_subcategory":
-        return await select_product_subcategory(update, context)
+async def cancel_add_product(query, context):
+    """Cancel adding a product."""
+    await query.message.reply_text(
+        "Product addition cancelled.",
+        reply_markup=get_main_menu_keyboard()
+    )
+    return MAIN_MENU
 
-    elif query.data == "skip_subcategory":
-        await query.message.reply_text(
-            f"Selected category: {context.user_data.get('product_category')}\n"
-            f"Subcategory: Skipped\n\n"
-            f"Now, what's the product name?",
-            reply_markup=get_cancel_keyboard()
-        )
-        return PRODUCT_NAME
 
-    # Scheduling
-    elif query.data.startswith("schedule_"):
-        if query.data in ["schedule_now", "schedule_later", "save_only"]:
-            return await handle_scheduling(update, context)
-        else:
-            product_id = query.data.split("_")[1]
-            return await handle_product_scheduling(query, context, product_id)
+async def skip_subcategory(query, context):
+    """Continue adding a product without a subcategory."""
+    await query.message.reply_text(
+        f"Selected category: {context.user_data.get('product_category')}\n"
+        f"Subcategory: Skipped\n\n"
+        f"Now, what's the product name?",
+        reply_markup=get_cancel_keyboard()
+    )
+    return PRODUCT_NAME
 
-    # Post product
-    elif query.data.startswith("post_"):
-        product_id = query.data.split("_")[1]
-        post_result = await post_product_by_id(context, product_id)
 
-        if post_result['success']:
-            # Show success message with view post button if available
-            if post_result.get('message_id'):
-                keyboard = [
-                    [InlineKeyboardButton("👁️ View Post",
-                                          url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{post_result['message_id']}")],
-                    [InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+async def post_product_now(query, context, product_id):
+    """Post a product to the channel right away."""
+    post_result = await post_product_by_id(context, product_id)
 
-                await query.message.reply_text(
-                    "✅ Product posted successfully! You can view it in the channel:",
-                    reply_markup=reply_markup
-                )
-            else:
-                await query.message.reply_text(
-                    "✅ Product posted successfully!",
-                    reply_markup=get_main_menu_keyboard()
-                )
+    if post_result['success']:
+        # Show success message with view post button if available
+        if post_result.get('message_id'):
+            keyboard = [
+                [InlineKeyboardButton("👁️ View Post",
+                                      url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{post_result['message_id']}")],
+                [InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+
+            await query.message.reply_text(
+                "✅ Product posted successfully! You can view it in the channel:",
+                reply_markup=reply_markup
+            )
         else:
             await query.message.reply_text(
-                f"❌ Error posting product: {post_result['message']}",
+                "✅ Product posted successfully!",
                 reply_markup=get_main_menu_keyboard()
             )
-
-        return MAIN_MENU
-
-    # Delete product
-    elif query.data.startswith("delete_"):
-        product_id = query.data.split("_")[1]
-        return await delete_product(query, context, product_id)
-
-    # Confirm delete product
-    elif query.data.startswith("confirm_delete_"):
-        product_id = query.data.split("_")[2]
-        return await confirm_delete_product(query, context, product_id)
-
-    # Edit product
-    elif query.data.startswith("edit_"):
-        product_id = query.data.split("_")[1]
+    else:
         await query.message.reply_text(
-            "Edit feature is currently under development.",
+            f"❌ Error posting product: {post_result['message']}",
             reply_markup=get_main_menu_keyboard()
         )
-        return MAIN_MENU
 
-    # Preferences
-    elif query.data == "toggle_auto_post":
-        return await toggle_preference(query, context, 'auto_post')
+    return MAIN_MENU
 
-    elif query.data == "toggle_notifications":
-        return await toggle_preference(query, context, 'notifications')
 
-    elif query.data == "toggle_theme":
-        return await toggle_theme(query, context)
+async def edit_product(query, context, product_id):
+    """Edit a product (not available yet)."""
+    await query.message.reply_text(
+        "Edit feature is currently under development.",
+        reply_markup=get_main_menu_keyboard()
+    )
+    return MAIN_MENU
 
-    # Registration
-    elif query.data in ["confirm_registration", "restart_registration"]:
-        return await register_confirm(update, context)
 
-    # Contact seller
-    elif query.data.startswith("contact_seller_"):
-        product_id = query.data.split("_")[2]
-        await show_seller_contact(query, context, product_id)
-        return MAIN_MENU
+async def edit_profile(query, context):
+    """Edit the user's profile (not available yet)."""
+    await query.message.reply_text(
+        "Profile editing feature is currently under development.",
+        reply_markup=get_main_menu_keyboard()
+    )
+    return MAIN_MENU
 
-    # Product details
-    elif query.data.startswith("product_details_"):
-        product_id = query.data.split("_")[2]
-        await show_product_details(query, context, product_id)
-        return MAIN_MENU
 
-    # Pagination
-    elif query.data.startswith("page_"):
-        page = int(query.data.split("_")[1])
-        products = load_products()
-        await show_product_page(query, context, products, page)
-        return MAIN_MENU
+async def view_channel_post(query, context, product_id):
+    """Link to a product's post in the channel."""
+    product = product_store.get(product_id)
 
-    # Edit profile
-    elif query.data == "edit_profile":
+    if product and product.get('channel_message_id'):
+        # Redirect to the post in the channel
+        await query.message.reply_text(
+            f"Opening the post in the channel...",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("👁️ View Post",
+                                     url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{product['channel_message_id']}")
+            ]])
+        )
+    else:
         await query.message.reply_text(
-            "Profile editing feature is currently under development.",
+            "Post not found or not yet published to the channel.",
             reply_markup=get_main_menu_keyboard()
         )
-        return MAIN_MENU
 
-    # View post in channel
-    elif query.data.startswith("view_post_"):
-        product_id = query.data.split("_")[2]
-        products = load_products()
+    return MAIN_MENU
 
-        # Find the product
-        product = None
-        for p in products:
-            if p.get('id') == product_id:
-                product = p
-                break
 
-        if product and product.get('channel_message_id'):
-            # Redirect to the post in the channel
-            await query.message.reply_text(
-                f"Opening the post in the channel...",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("👁️ View Post",
-                                         url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{product['channel_message_id']}")
-                ]])
-            )
-        else:
-            await query.message.reply_text(
-                "Post not found or not yet published to the channel.",
-                reply_markup=get_main_menu_keyboard()
-            )
+async def open_filter_panel(query, context):
+    """Show the filter panel, starting with an empty filter if the user has none."""
+    context.user_data.setdefault('product_filter', new_product_filter())
+    return await show_filter_panel(query, context)
 
-        return MAIN_MENU
 
-    return MAIN_MENU
+async def reset_product_filter(query, context):
+    """Clear the user's filter and redraw the panel."""
+    context.user_data['product_filter'] = new_product_filter()
+    return await show_filter_panel(query, context)
 
 
 async def delete_product(query, context, product_id):
     """Delete a product."""
-    products = load_products()
+    product = product_store.get(product_id)
 
-    # Find the product index
-    product_idx = None
-    for i, p in enumerate(products):
-        if p.get('id') == product_id:
-            product_idx = i
-            break
-
-    if product_idx is None:
+    if product is None:
         await query.message.reply_text(
             "Product not found.",
             reply_markup=get_main_menu_keyboard()
@@ -1443,11 +4508,9 @@ async def delete_product(query, context, product_id):
         return MAIN_MENU
 
     # Ask for confirmation
-    product = products[product_idx]
-
     # Create confirmation buttons
     keyboard = [
-        [InlineKeyboardButton("✅ Yes, Delete", callback_data=f"confirm_delete_{product_id}")],
+        [InlineKeyboardButton("✅ Yes, Delete", callback_data=encode_callback("cdel", product_id))],
         [InlineKeyboardButton("❌ No, Cancel", callback_data="back_to_main")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1463,28 +4526,17 @@ async def delete_product(query, context, product_id):
 
 async def confirm_delete_product(query, context, product_id):
     """Confirm and execute product deletion."""
-    products = load_products()
-
-    # Find the product index
-    product_idx = None
-    for i, p in enumerate(products):
-        if p.get('id') == product_id:
-            product_idx = i
-            break
+    # Remove the product
+    product = product_store.delete(product_id)
 
-    if product_idx is None:
+    if product is None:
         await query.message.reply_text(
             "Product not found or already deleted.",
             reply_markup=get_main_menu_keyboard()
         )
         return MAIN_MENU
 
-    # Get product name before deletion
-    product_name = products[product_idx]['name']
-
-    # Remove the product
-    del products[product_idx]
-    save_products(products)
+    product_name = product['name']
 
     # Confirm deletion
     await query.message.reply_text(
@@ -1497,14 +4549,7 @@ async def confirm_delete_product(query, context, product_id):
 
 async def show_seller_contact(query, context, product_id):
     """Show seller contact information."""
-    products = load_products()
-
-    # Find the product
-    product = None
-    for p in products:
-        if p.get('id') == product_id:
-            product = p
-            break
+    product = product_store.get(product_id)
 
     if not product:
         await query.message.reply_text(
@@ -1515,30 +4560,8 @@ async def show_seller_contact(query, context, product_id):
         )
         return
 
-    # Get seller information
-    seller_name = product.get('poster_name', 'Not provided')
-    seller_phone = product.get('poster_phone', 'Not provided')
-    seller_username = product.get('poster_username', 'Not provided')
-    seller_address = product.get('poster_address', 'Not provided')
-
-    message = (
-        f"📞 <b>Seller Contact Information</b>\n\n"
-        f"Product: <b>{product['name']}</b>\n\n"
-        f"<b>👤 @{seller_username}</b>\n"
-        f"Seller Name: {seller_name}\n"
-        f"Phone: {seller_phone}\n"
-        f"Address: {seller_address}\n\n"
-        f"You can contact the seller directly about this product."
-    )
-
-    keyboard = [[InlineKeyboardButton("🔙 Back", callback_data=f"product_details_{product_id}")]]
-
-    # Add View Post button if the product has been posted
-    if product.get('posted', False) and product.get('channel_message_id'):
-        keyboard.append([InlineKeyboardButton("👁️ View Post",
-                                              url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{product['channel_message_id']}")])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    seller_stats.record_contact_reveal(product, query.from_user.id)
+    message, reply_markup = product_renderer.render(product, 'contact')
 
     await query.message.reply_text(
         message,
@@ -1547,76 +4570,81 @@ async def show_seller_contact(query, context, product_id):
     )
 
 
-async def list_user_products(query, context):
-    """List products for the current user."""
-    user_id = query.from_user.id
-    products = load_products()
+async def list_user_products(query, context, page=0):
+    """List the current user's products as one page of compact text rows.
 
-    # Filter products by this user
-    user_products = [p for p in products if p.get('poster_id') == user_id]
+    Each page is a single message, edited in place when paging, so the cost in
+    API calls doesn't depend on the size of the inventory. Photos are only sent
+    when the seller taps a row's 📷 button.
+    """
+    user_id = query.from_user.id
+    user_products = product_store.by_poster(user_id)
 
     if not user_products:
-        await query.message.reply_text(
+        await edit_or_reply(
+            query,
             "You don't have any products yet.",
             reply_markup=get_main_menu_keyboard()
         )
-    else:
-        await query.message.reply_text(f"You have {len(user_products)} products:")
+        return MAIN_MENU
 
-        for i, product in enumerate(user_products):
-            if product.get('scheduled_time'):
-                status = f"⏰ Scheduled for {product['scheduled_time']}"
-            elif product.get('posted', False):
-                status = "✅ Posted"
-            else:
-                status = "⏳ Not posted yet"
+    page_count = (len(user_products) + MY_PRODUCTS_PAGE_SIZE - 1) // MY_PRODUCTS_PAGE_SIZE
+    # The list may have shrunk since the page button was sent
+    page = min(max(page, 0), page_count - 1)
+    start_idx = page * MY_PRODUCTS_PAGE_SIZE
 
-            # Create inline keyboard for each product
-            keyboard = [
-                [InlineKeyboardButton("📢 Post Now", callback_data=f"post_{product['id']}")],
-                [InlineKeyboardButton("✏️ Edit", callback_data=f"edit_{product['id']}")],
-                [InlineKeyboardButton("🗑️ Delete", callback_data=f"delete_{product['id']}")]
-            ]
+    rows = []
+    keyboard = []
+    for number, product in enumerate(user_products[start_idx:start_idx + MY_PRODUCTS_PAGE_SIZE], start=start_idx + 1):
+        row, _ = product_renderer.render(product, 'row')
+        rows.append(f"{number}. {row}")
+        _, reply_markup = product_renderer.render(product, 'owner')
+        keyboard.append([
+            InlineKeyboardButton(f"📷 {number}", callback_data=encode_callback("mph", product['id'])),
+            *compact_product_buttons(number, reply_markup)
+        ])
 
-            # Add View Post button if the product has been posted
-            if product.get('posted', False) and product.get('channel_message_id'):
-                keyboard.append([InlineKeyboardButton("👁️ View Post",
-                                                      url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{product['channel_message_id']}")])
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=encode_callback("mypage", page - 1)))
+    if page < page_count - 1:
+        nav_buttons.append(InlineKeyboardButton("➡️ Next", callback_data=encode_callback("mypage", page + 1)))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    keyboard.append([InlineKeyboardButton("➕ Add New Product", callback_data="add_product")])
+    keyboard.append([InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")])
+
+    await edit_or_reply(
+        query,
+        f"📦 <b>Your Products</b> ({len(user_products)})\n\n"
+        + "\n\n".join(rows)
+        + f"\n\nPage {page + 1} of {page_count}. Tap 📷 to see a product's photo.",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode='HTML'
+    )
+    return MAIN_MENU
 
-            reply_markup = InlineKeyboardMarkup(keyboard)
 
-            # Format category info
-            category_info = ""
-            if product.get('category'):
-                category_info = f"{product.get('category')}"
-                if product.get('subcategory'):
-                    category_info += f" - {product.get('subcategory')}"
-                category_info += "\n"
+async def show_my_product_photo(query, context, product_id):
+    """Send the photo card of one of the user's products, below their product list."""
+    product = product_store.get(product_id)
 
-            await query.message.reply_photo(
-                photo=product['image_file_id'],
-                caption=f"Product #{i + 1}\n"
-                        f"Name: {product['name']}\n"
-                        f"{category_info}"
-                        f"Price: {product['price']:.2f} ETB\n"
-                        f"Added: {product['date_added']}\n"
-                        f"Status: {status}",
-                reply_markup=reply_markup
-            )
+    if not product or product.get('poster_id') != query.from_user.id:
+        await query.message.reply_text("Product not found.")
+        return MAIN_MENU
 
+    caption, reply_markup = product_renderer.render(product, 'owner')
+    await query.message.reply_photo(
+        photo=product['image_file_id'],
+        caption=caption,
+        reply_markup=reply_markup
+    )
     return MAIN_MENU
 
 
 async def handle_product_scheduling(query, context, product_id):
     """Handle scheduling for a specific product."""
-    products = load_products()
-
-    # Find the product
-    product = None
-    for p in products:
-        if p.get('id') == product_id:
-            product = p
-            break
+    product = product_store.get(product_id)
 
     if not product:
         await query.message.reply_text(
@@ -1687,7 +4715,8 @@ async def refresh_preferences(query, context):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    await query.message.reply_text(
+    await edit_or_reply(
+        query,
         "⭐ <b>Preferences</b>\n\n"
         "Customize your experience by adjusting the settings below:",
         reply_markup=reply_markup,
@@ -1699,17 +4728,11 @@ async def refresh_preferences(query, context):
 
 async def show_product_details(query, context, product_id):
     """Show detailed information about a product."""
-    products = load_products()
-
-    # Find the product
-    product = None
-    for p in products:
-        if p.get('id') == product_id:
-            product = p
-            break
+    product = product_store.get(product_id)
 
     if not product:
-        await query.message.reply_text(
+        await edit_or_reply(
+            query,
             "Product not found.",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("🔙 Back", callback_data="back_to_main")
@@ -1717,52 +4740,12 @@ async def show_product_details(query, context, product_id):
         )
         return
 
-    # Status indicator
-    if product.get('scheduled_time'):
-        status = f"⏰ Scheduled for {product['scheduled_time']}"
-    elif product.get('posted', False):
-        status = f"✅ Posted"
-    else:
-        status = "⏳ Not posted yet"
-
-    # Format category info
-    category_info = ""
-    if product.get('category'):
-        category_info = f"{product.get('category')}"
-        if product.get('subcategory'):
-            category_info += f" - {product.get('subcategory')}"
-        category_info += "\n\n"
-
-    # Create detailed message
-    message = (
-        f"📦 <b>{product['name']}</b>\n\n"
-        f"{category_info}"
-        f"📝 <b>Description:</b>\n{product['description']}\n\n"
-        f"💰 <b>Price:</b> {product['price']:.2f} ETB\n"
-        f"📅 <b>Added:</b> {product['date_added']}\n"
-        f"🔄 <b>Status:</b> {status}"
-    )
-
-    # Create action buttons
-    keyboard = []
-
-    # Only show post button if not already posted
-    if not product.get('posted', False):
-        keyboard.append([InlineKeyboardButton("📢 Post Now", callback_data=f"post_{product['id']}")])
-
-    keyboard.append([InlineKeyboardButton("📞 Contact Seller", callback_data=f"contact_seller_{product['id']}")])
-
-    # Add View Post button if the product has been posted
-    if product.get('posted', False) and product.get('channel_message_id'):
-        keyboard.append([InlineKeyboardButton("👁️ View Post",
-                                              url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{product['channel_message_id']}")])
-
-    keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="back_to_main")])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    seller_stats.record_view(product, query.from_user.id)
+    message, reply_markup = product_renderer.render(product, 'details')
 
     # Edit the message with detailed info
-    await query.message.reply_text(
+    await edit_or_reply(
+        query,
         message,
         reply_markup=reply_markup,
         parse_mode='HTML'
@@ -1771,15 +4754,10 @@ async def show_product_details(query, context, product_id):
 
 async def post_product_by_id(context, product_id, query=None):
     """Post a product to the channel by its ID."""
-    products = load_products()
     result = {'success': False, 'message': '', 'message_id': None}
 
     # Find the product with the given ID
-    product = None
-    for p in products:
-        if p.get('id') == product_id:
-            product = p
-            break
+    product = product_store.get(product_id)
 
     if not product:
         result['message'] = "Product not found."
@@ -1787,109 +4765,59 @@ async def post_product_by_id(context, product_id, query=None):
             await query.message.reply_text(result['message'])
         return result
 
-    try:
-        # Create inline keyboard with contact seller button
-        keyboard = []
-        if product.get('poster_username'):
-            keyboard.append([InlineKeyboardButton("📞 Contact Seller",
-                                                  url=f"https://t.me/{product.get('poster_username')}")])
-        else:
-            # Fallback to deep link if no username
-            keyboard.append([InlineKeyboardButton("📞 Contact Seller",
-                                                  url=f"https://t.me/{context.bot.username}?start=item_{product_id}")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        # Format category info
-        category_info = ""
-        if product.get('category'):
-            category_info = f"{product.get('category')}"
-            if product.get('subcategory'):
-                category_info += f" - {product.get('subcategory')}"
-            category_info += "\n\n"
-
-        # Post to channel
-        message = await context.bot.send_photo(
-            chat_id=CHANNEL_ID,
-            photo=product['image_file_id'],
-            caption=f"🆕 NEW PRODUCT 🆕\n\n"
-                    f"📌 {product['name']}\n\n"
-                    f"{category_info}"
-                    f"📝 {product['description']}\n\n"
-                    f"💰 Price: {product['price']:.2f} ETB\n\n"
-                    f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-            reply_markup=reply_markup
-        )
-
-        # Update product status and store message ID
-        for p in products:
-            if p.get('id') == product_id:
-                p['posted'] = True
-                p['post_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                p['channel_message_id'] = message.message_id
-                break
-
-        save_products(products)
-        posted_products.add(product_id)
-
-        result['success'] = True
-        result['message'] = f"Product '{product['name']}' posted to the channel successfully!"
-        result['message_id'] = message.message_id
-
+    if product.get('posted', False):
+        result['message'] = "This product is already posted to the channel."
         if query:
             await query.message.reply_text(result['message'])
-
         return result
 
-    except Exception as e:
-        logger.error(f"Error posting to channel: {e}")
+    status, detail = await channel_delivery.post(context.bot, product_id)
+
+    if status == 'posted':
+        result['success'] = True
+        result['message'] = f"Product '{product['name']}' posted to the channel successfully!"
+        result['message_id'] = detail
+    elif status == 'retrying':
+        result['message'] = (
+            "Telegram couldn't take the post right now (flood limit or no connection). It will be "
+            f"retried automatically in a few seconds.\n\nError: {detail}"
+        )
+    elif status == 'unknown':
+        result['message'] = (
+            "Telegram did not confirm the post, so it may already be in the channel. It won't be sent "
+            f"again automatically; the admin can re-send it after checking the channel.\n\nError: {detail}"
+        )
+    else:
         result['message'] = (
             f"Error posting to channel. Make sure the bot is an admin in the channel "
-            f"and has posting permissions.\n\nError: {str(e)}"
+            f"and has posting permissions.\n\nError: {detail}"
         )
-        if query:
-            await query.message.reply_text(result['message'])
 
-        return result
+    if query:
+        await query.message.reply_text(result['message'])
+
+    return result
 
 
 async def auto_post_products(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Automatically post products to the channel."""
+    """Auto-post the next product in the planner's rotation.
+
+    Runs every AUTO_POST_INTERVAL / AUTO_POST_LIMIT, so the channel gets an
+    evenly spaced stream of single posts instead of a burst per interval.
+    """
     if not AUTO_POST_ENABLED:
         return
 
-    logger.info("Running scheduled auto-post job")
-    products = load_products()
-
-    # Filter products that haven't been posted yet and aren't scheduled
-    unposted_products = [p for p in products if not p.get('posted', False)
-                         and p.get('id') not in posted_products
-                         and not p.get('scheduled_time')]
-
-    if not unposted_products:
+    product_id = auto_post_planner.next_ready()
+    if product_id is None:
         logger.info("No unposted products found")
         return
 
-    # Select products to post (up to the limit)
-    to_post = unposted_products[:AUTO_POST_LIMIT]
-
-    # Post each product
-    for product in to_post:
-        # Check if user has auto-post enabled in preferences
-        user_id = product.get('poster_id')
-        if user_id:
-            prefs = get_user_preferences(user_id)
-            if not prefs.get('auto_post', True):
-                logger.info(f"Skipping auto-post for product '{product['name']}' as user has disabled auto-post")
-                continue
-
-        post_result = await post_product_by_id(context, product['id'])
-        if post_result['success']:
-            logger.info(f"Auto-posted product: {product['name']}")
-        else:
-            logger.error(f"Failed to auto-post product: {product['name']}")
-
-        # Add a small delay between posts to avoid flooding
-        await asyncio.sleep(2)
+    post_result = await post_product_by_id(context, product_id)
+    if post_result['success']:
+        logger.info(f"Auto-posted product: {product_id}")
+    else:
+        logger.error(f"Failed to auto-post product {product_id}: {post_result['message']}")
 
 
 async def handle_deep_linking(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -1900,7 +4828,7 @@ async def handle_deep_linking(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Check if this is a deep link
     if context.args and (context.args[0].startswith("contact_") or context.args[0].startswith("item_")):
         # Extract product ID
-        product_id = context.args[0].split("_")[1]
+        product_id = context.args[0].partition("_")[2]
         logger.info(f"Processing deep link for product {product_id}")
 
         # Check if user is registered
@@ -1937,14 +4865,7 @@ async def show_seller_contact_from_deeplink(update, context, product_id):
         except Exception as e:
             logger.error(f"Error deleting message: {e}")
 
-    products = load_products()
-
-    # Find the product
-    product = None
-    for p in products:
-        if p.get('id') == product_id:
-            product = p
-            break
+    product = product_store.get(product_id)
 
     if not product:
         logger.error(f"Product {product_id} not found when trying to show seller contact")
@@ -1954,35 +4875,8 @@ async def show_seller_contact_from_deeplink(update, context, product_id):
         )
         return
 
-    # Get seller information
-    seller_name = product.get('poster_name', 'Not provided')
-    seller_phone = product.get('poster_phone', 'Not provided')
-    seller_username = product.get('poster_username', 'Not provided')
-    seller_address = product.get('poster_address', 'Not provided')
-
-    # Format product price
-    price = f"{product.get('price', 0):.2f} ETB"
-
-    # Create caption with seller details
-    caption = (
-        f"🔔 <b>NEW LISTING: {product['name']}</b>\n\n"
-        f"💰 <b>Price:</b> {price}\n\n"
-        f"👤 <b>SELLER DETAILS:</b>\n"
-        f"<b>👤 @{seller_username}</b>\n"
-        f"📋 <b>Name:</b> {seller_name}\n"
-        f"📱 <b>Phone:</b> {seller_phone}\n"
-        f"📍 <b>Address:</b> {seller_address}\n\n"
-        f"⌛️ <b>Only one available!</b>"
-    )
-
-    keyboard = [[InlineKeyboardButton("🔙 Back to Main Menu", callback_data="back_to_main")]]
-
-    # Add View Post button if the product has been posted
-    if product.get('posted', False) and product.get('channel_message_id'):
-        keyboard.insert(0, [InlineKeyboardButton("👁️ View Post",
-                                                 url=f"https://t.me/{CHANNEL_ID.replace('@', '')}/{product['channel_message_id']}")])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    seller_stats.record_contact_reveal(product, update.effective_user.id)
+    caption, reply_markup = product_renderer.render(product, 'listing')
 
     # Send product image with seller information as caption
     try:
@@ -2042,7 +4936,8 @@ async def notify_seller_of_interest(context, product, interested_user):
                  f"Name: {buyer_name}\n"
                  f"Username: {buyer_username}\n\n"
                  f"They have viewed your contact information and may contact you soon.",
-            parse_mode='HTML'
+            parse_mode='HTML',
+            rate_limit_args='notification'
         )
 
         logger.info(
@@ -2052,10 +4947,153 @@ async def notify_seller_of_interest(context, product, interested_user):
         logger.error(f"Failed to notify seller {seller_id}: {e}")
 
 
+async def dead_letters_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """List channel posts that failed for good (admin only)."""
+    if not is_admin(update.effective_user.username):
+        await update.message.reply_text("This command is only available to the admin.")
+        return
+
+    entries = channel_delivery.dead_letters()
+    if not entries:
+        await update.message.reply_text("✅ No failed channel posts.")
+        return
+
+    lines = [f"❌ {len(entries)} failed channel posts:\n"]
+    for product_id, entry in entries[:DEAD_LETTERS_SHOWN]:
+        lines.append(
+            f"{product_id} - {entry['name']}\n"
+            f"{entry['failed_at']}, {entry['kind']} after {entry['attempts']} attempt(s): {entry['error']}\n"
+        )
+    if len(entries) > DEAD_LETTERS_SHOWN:
+        lines.append(f"...and {len(entries) - DEAD_LETTERS_SHOWN} more.\n")
+    lines.append("Send /redrive to retry all of them, or /redrive <id> for one.")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def redrive_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Retry failed channel posts: /redrive [product ids] (admin only)."""
+    if not is_admin(update.effective_user.username):
+        await update.message.reply_text("This command is only available to the admin.")
+        return
+
+    moved = channel_delivery.redrive(context.args or None)
+    await update.message.reply_text(f"🔁 {moved} failed post(s) queued for another attempt.")
+
+
+async def on_startup(application: Application) -> None:
+    """Start background services once the event loop is running."""
+    storage_writer.start()
+    channel_delivery.start(application.bot)
+    post_scheduler.start(application.bot)
+
+
+async def on_shutdown(application: Application) -> None:
+    """Flush pending writes before the process exits."""
+    await post_scheduler.stop()
+    await channel_delivery.stop()
+    await storage_writer.stop()
+    if hasattr(storage, 'compact'):
+        await storage.compact()
+    # Posted flags are saved now, so their 'sent' records are no longer needed
+    if not storage_writer.is_dirty(PRODUCTS_FILE):
+        channel_outbox.compact(settled=channel_outbox.sent_ids())
+
+
+async def compact_outbox(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Periodically drop outbox records of posts whose posted flag has been saved."""
+    # Only records that exist now: a post finishing during the flush isn't saved by it
+    sent = channel_outbox.sent_ids()
+    if not sent:
+        return
+    await storage_writer.flush()
+    if not storage_writer.is_dirty(PRODUCTS_FILE):
+        channel_outbox.compact(settled=sent)
+
+
+async def compact_storage(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Periodically fold the storage journals into their snapshots."""
+    await storage.compact()
+
+
+# Inline button routes. Products are addressed by id, result lists by cursor token,
+# categories by ProductStore.tag_key().
+callback_router.add("back_to_main", back_to_main_menu)
+
+# Product management
+callback_router.add("add_product", add_product_start)
+callback_router.add("cancel_add_product", cancel_add_product)
+callback_router.add("list_my_products", list_user_products, edits_in_place=True)
+callback_router.add("mypage", list_user_products, int, edits_in_place=True)
+# Keeps the list where it is and sends the photo below it
+callback_router.add("mph", show_my_product_photo, str, edits_in_place=True)
+callback_router.add("product_stats", show_product_stats)
+callback_router.add("post", post_product_now, str)
+callback_router.add("edit", edit_product, str)
+callback_router.add("del", delete_product, str)
+callback_router.add("cdel", confirm_delete_product, str)
+callback_router.add("view", view_channel_post, str)
+
+# Category and subcategory selection while adding a product
+callback_router.add_prefix("category_", select_product_category, pass_update=True)
+callback_router.add("custom_category", select_product_category, pass_update=True)
+callback_router.add("back_to_categories", select_product_category, pass_update=True)
+callback_router.add_prefix("subcategory_", select_product_subcategory, pass_update=True)
+callback_router.add("custom_subcategory", select_product_subcategory, pass_update=True)
+callback_router.add("skip_subcategory", skip_subcategory)
+
+# Scheduling
+callback_router.add("schedule_now", handle_scheduling, pass_update=True)
+callback_router.add("schedule_later", handle_scheduling, pass_update=True)
+callback_router.add("save_only", handle_scheduling, pass_update=True)
+callback_router.add("sch", handle_product_scheduling, str)
+
+# Registration
+callback_router.add("confirm_registration", register_confirm, pass_update=True)
+callback_router.add("restart_registration", register_confirm, pass_update=True)
+
+# Account and preferences
+callback_router.add("edit_profile", edit_profile)
+callback_router.add("edit_preferences", refresh_preferences, edits_in_place=True)
+callback_router.add("toggle_auto_post", lambda query, context: toggle_preference(query, context, 'auto_post'),
+                    edits_in_place=True)
+callback_router.add("toggle_notifications", lambda query, context: toggle_preference(query, context, 'notifications'),
+                    edits_in_place=True)
+callback_router.add("toggle_theme", toggle_theme, edits_in_place=True)
+
+# Product views and navigation
+callback_router.add("det", show_product_details, str, edits_in_place=True)
+callback_router.add("seller", show_seller_contact, str)
+callback_router.add("page", show_cursor_page, str, int, edits_in_place=True)
+callback_router.add("browse", browse_categories, edits_in_place=True)
+callback_router.add("bcat", browse_subcategories, str, edits_in_place=True)
+callback_router.add("bpage", browse_category_page, str, str, edits_in_place=True)
+callback_router.add("filter", open_filter_panel, edits_in_place=True)
+callback_router.add("flt", update_product_filter, str, str, edits_in_place=True)
+callback_router.add("freset", reset_product_filter, edits_in_place=True)
+callback_router.add("fshow", show_filtered_products, edits_in_place=True)
+
+
 def main() -> None:
     """Start the bot."""
+    # Load the product catalog, users and preferences once; handlers read from memory
+    seller_stats.load()
+    product_store.load()
+    channel_delivery.load()
+    channel_outbox.load()
+    channel_outbox.reconcile()
+    user_directory.load()
+    preference_cache.load()
+
     # Create the Application
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .rate_limiter(outbound_dispatcher)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     # Add conversation handler for the entire bot interaction
     conv_handler = ConversationHandler(
@@ -2136,18 +5174,39 @@ def main() -> None:
     # Add command handlers
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("filter", filter_command))
+    application.add_handler(CommandHandler("deadletters", dead_letters_command))
+    application.add_handler(CommandHandler("redrive", redrive_command))
+    application.add_handler(InlineQueryHandler(inline_search))
+
+    # Compact the storage journals in the background
+    if hasattr(storage, 'compact'):
+        application.job_queue.run_repeating(
+            compact_storage,
+            interval=JOURNAL_COMPACT_INTERVAL,
+            first=JOURNAL_COMPACT_INTERVAL,
+            name="compact_storage"
+        )
+
+    application.job_queue.run_repeating(
+        compact_outbox,
+        interval=OUTBOX_COMPACT_INTERVAL,
+        first=OUTBOX_COMPACT_INTERVAL,
+        name="compact_outbox"
+    )
 
     # Set up auto-posting using the application's job queue
     if AUTO_POST_ENABLED:
         # Schedule auto-posting using the application's job queue
         application.job_queue.run_repeating(
             auto_post_products,
-            interval=timedelta(hours=AUTO_POST_INTERVAL),
+            interval=timedelta(hours=AUTO_POST_INTERVAL) / AUTO_POST_LIMIT,
             first=60,  # Start 60 seconds after bot startup
             name="auto_post"
         )
 
-        logger.info(f"Auto-posting scheduled every {AUTO_POST_INTERVAL} hours")
+        logger.info(f"Auto-posting {AUTO_POST_LIMIT} products every {AUTO_POST_INTERVAL} hours")
 
     # Start the Bot
     logger.info("Starting bot...")
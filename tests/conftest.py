@@ -0,0 +1,15 @@
+import importlib.util
+import os
+
+import pytest
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tele-bot.py')
+
+
+@pytest.fixture(scope='session')
+def bot():
+    """The bot module. tele-bot.py is not an importable name, so it is loaded from its path."""
+    spec = importlib.util.spec_from_file_location('tele_bot', BOT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
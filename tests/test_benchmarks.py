@@ -0,0 +1,124 @@
+"""Timing runs over synthetic data; run with -s to see the numbers.
+
+Sizes are kept small so the suite stays fast. Only the results are asserted,
+never the timings.
+"""
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+
+def make_product_dict(bot, i):
+    categories = list(bot.PRODUCT_CATEGORIES.items())
+    category, subcategories = categories[i % len(categories)]
+    return {
+        'id': str(1715000000.0 + i / 1000),
+        'name': f"Product {i}",
+        'description': f"Description of product {i}",
+        'price': float(i % 50000),
+        'category': category,
+        'subcategory': subcategories[i % len(subcategories)],
+        'image_file_id': f"AgACAgQAAxkBAAI{i:012d}",
+        'date_added': "2025-05-15 14:30:00",
+        'posted': i % 3 == 0,
+        'poster_username': f"seller{i % 1000}",
+        'poster_id': 100000 + i % 1000,
+        'poster_name': f"Seller {i % 1000}",
+        'poster_phone': "+251912345678",
+        'poster_address': "Addis Ababa",
+        'scheduled_time': None,
+        'channel_message_id': None
+    }
+
+
+def test_product_records_use_less_memory_than_dicts(bot, count=20_000):
+    def measure(build):
+        tracemalloc.start()
+        items = [build(make_product_dict(bot, i)) for i in range(count)]
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del items
+        return used
+
+    # The input strings are counted in both runs, as they would be in a loaded catalog
+    dict_bytes = measure(lambda p: p)
+    record_bytes = measure(lambda p: bot.Product(**p))
+    print(
+        f"{count:,} products: dicts {dict_bytes / count:.0f} B/product, "
+        f"records {record_bytes / count:.0f} B/product, saving {1 - record_bytes / dict_bytes:.0%}"
+    )
+    assert record_bytes < dict_bytes
+
+
+def test_search_index(bot, count=20_000):
+    categories = list(bot.PRODUCT_CATEGORIES.items())
+    brands = ["Samsung Galaxy phone", "iPhone", "ሶፋ ለሽያጭ", "Lenovo laptop", "ቀሚስ dress", "Toyota Vitz"]
+    products = []
+    for i in range(count):
+        category, subcategories = categories[i % len(categories)]
+        products.append(bot.Product(
+            id=bot.base62_encode(i, bot.PRODUCT_ID_WIDTH),
+            name=f"{brands[i % len(brands)]} {i}",
+            description=f"Product {i} in good condition, {brands[(i * 7) % len(brands)]}",
+            price=float(i % 50000),
+            category=category,
+            subcategory=subcategories[i % len(subcategories)],
+        ))
+
+    index = bot.SearchIndex()
+    started = time.perf_counter()
+    index.rebuild(products)
+    print(f"Indexed {count:,} products in {time.perf_counter() - started:.2f}s")
+
+    for text in ("phone", "samsung galaxy", "ሶፋ", "elec", "product 4242"):
+        started = time.perf_counter()
+        results = index.search(text)
+        print(f"{text!r:>18}: {len(results):>4} results in {(time.perf_counter() - started) * 1000:7.2f} ms")
+        assert 0 < len(results) <= bot.SEARCH_RESULT_LIMIT
+
+    assert bot.base62_encode(4242, bot.PRODUCT_ID_WIDTH) in index.search("product 4242")
+
+
+def test_callback_router_resolve(bot, iterations=20_000):
+    samples = [
+        "back_to_main",
+        bot.encode_callback("det", "1ecsDOWVk"),
+        bot.encode_callback("page", "3", 7),
+        bot.encode_callback("flt", "p", 2),
+        "category_#Electronics",
+    ]
+    for data in samples:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            route, _ = bot.callback_router.resolve(data)
+        elapsed = time.perf_counter() - started
+        print(f"{data!r:>26}: {elapsed / iterations * 1e9:6.0f} ns per resolve")
+        assert route is not None
+
+
+def test_post_scheduler(bot, count=20_000):
+    scheduler = bot.PostScheduler()
+    start = datetime.now()
+    products = [
+        {'id': str(i), 'posted': False,
+         'scheduled_time': (start + timedelta(minutes=(i * 7919) % count)).strftime("%Y-%m-%d %H:%M:%S")}
+        for i in range(count)
+    ]
+
+    started = time.perf_counter()
+    scheduler.rebuild(products)
+    print(f"rebuild of {len(scheduler)} schedules: {(time.perf_counter() - started) * 1000:.1f} ms")
+    assert len(scheduler) == count
+
+    started = time.perf_counter()
+    for product in products[::10]:
+        scheduler.replace(product, dict(product, scheduled_time=start.strftime("%Y-%m-%d %H:%M:%S")))
+    elapsed = time.perf_counter() - started
+    print(f"reschedule: {elapsed / len(products[::10]) * 1e6:.1f} us per product")
+
+    started = time.perf_counter()
+    due = scheduler.pop_due((start + timedelta(minutes=count)).timestamp())
+    elapsed = time.perf_counter() - started
+    print(f"drained {len(due)} due posts in {elapsed * 1000:.1f} ms, left: {len(scheduler)}")
+    assert all(a[1] <= b[1] for a, b in zip(due, due[1:]))
+    assert len(due) == count and len(scheduler) == 0
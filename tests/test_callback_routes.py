@@ -0,0 +1,62 @@
+import ast
+
+
+def find_route_problems(bot):
+    """Return (checked sites, problems) for every callback_data the bot source can emit.
+
+    Looks at every callback_data= keyword and encode_callback() call: plain
+    strings must resolve, f-strings must start with a registered prefix or
+    action, and encode_callback() calls with a literal action must pass as
+    many arguments as the route's schema. Buttons whose callback_data is
+    built entirely at runtime are skipped.
+    """
+    with open(bot.__file__, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+
+    routes = bot.callback_router.routes()
+    prefixes = bot.callback_router.prefix_routes()
+    problems = []
+    checked = 0
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+
+        if isinstance(node.func, ast.Name) and node.func.id == 'encode_callback' and node.args:
+            action = node.args[0]
+            if not (isinstance(action, ast.Constant) and isinstance(action.value, str)):
+                continue
+            checked += 1
+            route = routes.get(action.value)
+            if route is None:
+                problems.append(f"line {node.lineno}: no route for action {action.value!r}")
+            elif not any(isinstance(arg, ast.Starred) for arg in node.args) and len(node.args) - 1 != len(route.schema):
+                problems.append(f"line {node.lineno}: {action.value!r} takes {len(route.schema)} arguments, "
+                                f"got {len(node.args) - 1}")
+            continue
+
+        for keyword in node.keywords:
+            if keyword.arg != 'callback_data':
+                continue
+            value = keyword.value
+            if isinstance(value, ast.Constant) and isinstance(value.value, str):
+                checked += 1
+                if bot.callback_router.resolve(value.value)[0] is None:
+                    problems.append(f"line {node.lineno}: no route for {value.value!r}")
+            elif isinstance(value, ast.JoinedStr) and value.values and isinstance(value.values[0], ast.Constant):
+                checked += 1
+                head = value.values[0].value
+                if head not in prefixes and head.rstrip(bot.CALLBACK_SEPARATOR) not in routes:
+                    problems.append(f"line {node.lineno}: no route for f-string starting {head!r}")
+
+    return checked, sorted(problems)
+
+
+def test_every_callback_data_has_a_route(bot):
+    checked, problems = find_route_problems(bot)
+    assert checked > 0
+    assert problems == []
+
+
+def test_unknown_callback_data_does_not_resolve(bot):
+    assert bot.callback_router.resolve("no_such_button") == (None, None)
@@ -0,0 +1,60 @@
+import gc
+
+
+def make_product(bot, name, category='#Electronics'):
+    return bot.Product(
+        id=bot.product_ids.next_id(), name=name, description='d', price=1.0, image_file_id='f',
+        poster_id=5, category=category, subcategory='', posted=False, date_added='2026-10-01 10:00:00'
+    )
+
+
+def test_snapshot_keeps_its_version(bot, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = bot.ProductStore()
+    store.load()
+    first, second = store.add(make_product(bot, 'first')), store.add(make_product(bot, 'second'))
+
+    snapshot = store.snapshot()
+    store.update(first['id'], name='renamed')
+    store.delete(second['id'])
+    third = store.add(make_product(bot, 'third'))
+
+    assert list(snapshot.order) == [first['id'], second['id']]
+    assert snapshot.get(first['id'])['name'] == 'first'
+    assert snapshot.get(second['id']) is second
+    assert snapshot.get(third['id']) is None
+
+    latest = store.snapshot()
+    assert latest.get(first['id'])['name'] == 'renamed'
+    assert latest.get(second['id']) is None
+    assert [pid for pid in latest.order if latest.get(pid) is not None] == [first['id'], third['id']]
+
+
+def test_history_is_dropped_with_the_last_old_snapshot(bot, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = bot.ProductStore()
+    store.load()
+    product = store.add(make_product(bot, 'product'))
+
+    snapshot = store.snapshot()
+    store.update(product['id'], price=2.0)
+    assert store._history
+
+    del snapshot
+    gc.collect()
+    store.update(product['id'], price=3.0)
+    assert not store._history
+
+
+def test_category_view_is_stable(bot, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = bot.ProductStore()
+    store.load()
+    products = [store.add(make_product(bot, f'p{i}')) for i in range(3)]
+
+    view = store.category_ids('#Electronics')
+    store.delete(products[0]['id'])
+    store.add(make_product(bot, 'later'))
+
+    assert list(view) == [p['id'] for p in products]
+    assert store.category_count('#Electronics') == 3